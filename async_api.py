@@ -0,0 +1,179 @@
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+from project_board import ProjectBoard
+from team import TeamManager
+from user import UserManager
+
+_executor = None
+# event loop -> collection -> the lock its flushes take. An asyncio.Lock belongs to the loop
+# it is first used on, so each loop (e.g. one per asyncio.run) has its own.
+_flush_locks = weakref.WeakKeyDictionary()
+
+
+def _default_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="planner-io")
+    return _executor
+
+
+class _AsyncManager:
+    """
+    asyncio front end for one of the blocking managers.
+
+    Writes run on a bounded thread pool with their disk writes deferred: the
+    change is applied in memory, then the call waits for the flush of every
+    collection it touched. Concurrent writes to the same file share a flush,
+    so a burst of N writes costs far fewer than N disk writes, and a call
+    still only returns once its change is on disk.
+
+    With the json backend, reads are answered straight from memory on the
+    event loop, unless they need the disk: picking up another process's
+    writes or opening a board's tasks for the first time sends them to the
+    pool instead, like every read with sqlite or mmap.
+    """
+
+    def __init__(self, manager, executor=None):
+        self.manager = manager
+        self._executor = executor or _default_executor()
+
+    async def _read(self, method, *args):
+        if self.manager.backend == "json":
+            try:
+                with storage.nonblocking():
+                    return method(*args)
+            except storage.WouldBlock:
+                # nothing was read from disk yet, the pool runs it again from the start
+                pass
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+
+    def _run_deferred(self, method, request):
+        with storage.deferred_writes():
+            return method(request)
+
+    async def _write(self, method, request):
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._executor, self._run_deferred, method, request)
+
+        # everything committed up to now has to be on disk before we answer
+        targets = [(collection, collection.committed) for collection in storage.unflushed_collections()]
+        for collection, committed in targets:
+            await self._flush(collection, committed)
+        return result
+
+    async def _flush(self, collection, committed):
+        loop = asyncio.get_running_loop()
+        lock = _flush_locks.setdefault(loop, {}).setdefault(collection, asyncio.Lock())
+        async with lock:
+            # a flush that ran while we waited may already have written our change
+            if collection.flushed >= committed:
+                return
+            await loop.run_in_executor(self._executor, collection.flush)
+
+
+class AsyncUserManager(_AsyncManager):
+
+    def __init__(self, manager=None, executor=None, **kwargs):
+        super().__init__(manager or UserManager(**kwargs), executor)
+
+    async def create_user(self, request: str) -> str:
+        return await self._write(self.manager.create_user, request)
+
+    async def create_users(self, request: str) -> str:
+        return await self._write(self.manager.create_users, request)
+
+    async def list_users(self, request: str = None) -> str:
+        if request is None:
+            return await self._read(self.manager.list_users)
+        return await self._read(self.manager.list_users, request)
+
+    async def describe_user(self, request: str) -> str:
+        return await self._read(self.manager.describe_user, request)
+
+    async def update_user(self, request: str) -> str:
+        return await self._write(self.manager.update_user, request)
+
+    async def get_user_teams(self, request: str) -> str:
+        return await self._read(self.manager.get_user_teams, request)
+
+
+class AsyncTeamManager(_AsyncManager):
+
+    def __init__(self, manager=None, executor=None, **kwargs):
+        super().__init__(manager or TeamManager(**kwargs), executor)
+
+    async def create_team(self, request: str) -> str:
+        return await self._write(self.manager.create_team, request)
+
+    async def list_teams(self, request: str = None) -> str:
+        if request is None:
+            return await self._read(self.manager.list_teams)
+        return await self._read(self.manager.list_teams, request)
+
+    async def describe_team(self, request: str) -> str:
+        return await self._read(self.manager.describe_team, request)
+
+    async def update_team(self, request: str) -> str:
+        return await self._write(self.manager.update_team, request)
+
+    async def add_users_to_team(self, request: str):
+        return await self._write(self.manager.add_users_to_team, request)
+
+    async def remove_users_from_team(self, request: str):
+        return await self._write(self.manager.remove_users_from_team, request)
+
+    async def list_team_users(self, request: str):
+        return await self._read(self.manager.list_team_users, request)
+
+
+class AsyncProjectBoard(_AsyncManager):
+
+    def __init__(self, manager=None, executor=None, **kwargs):
+        super().__init__(manager or ProjectBoard(**kwargs), executor)
+
+    async def create_board(self, request: str):
+        return await self._write(self.manager.create_board, request)
+
+    async def close_board(self, request: str) -> str:
+        return await self._write(self.manager.close_board, request)
+
+    async def add_task(self, request: str) -> str:
+        return await self._write(self.manager.add_task, request)
+
+    async def add_tasks(self, request: str) -> str:
+        return await self._write(self.manager.add_tasks, request)
+
+    async def update_task_status(self, request: str):
+        return await self._write(self.manager.update_task_status, request)
+
+    async def update_task_statuses(self, request: str) -> str:
+        return await self._write(self.manager.update_task_statuses, request)
+
+    async def list_boards(self, request: str) -> str:
+        return await self._read(self.manager.list_boards, request)
+
+    async def board_summary(self, request: str) -> str:
+        return await self._read(self.manager.board_summary, request)
+
+    async def team_summary(self, request: str) -> str:
+        return await self._read(self.manager.team_summary, request)
+
+    async def search_tasks(self, request: str) -> str:
+        return await self._read(self.manager.search_tasks, request)
+
+    async def list_user_tasks(self, request: str) -> str:
+        return await self._read(self.manager.list_user_tasks, request)
+
+    async def export_board(self, request: str) -> str:
+        # writes a file under out/, keep it off the event loop
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.manager.export_board, request
+        )
+
+    async def export_boards(self, request: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.manager.export_boards, request
+        )
@@ -0,0 +1,270 @@
+"""
+Benchmark every public API method against a synthetic database.
+
+    python bench.py --users 10000 --teams 1000 --boards 5000 --tasks 100000 --output bench.json
+
+The database is seeded in a temporary directory (kept with --keep), then each
+method is called --calls times. For every method the report holds latency
+percentiles in milliseconds, throughput in calls per second and, with
+--trace-memory, the peak memory allocated while the method ran. The process
+peak RSS after seeding is reported as well. Compare two runs by diffing their
+JSON output. --instrument adds the instrumentation stats of every method.
+Cached read methods mostly hit the response cache after their first call,
+--no-cache measures them against the collections instead.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+import instrumentation
+from cache import responses
+from project_board import ProjectBoard
+from team import TeamManager
+from user import UserManager
+
+SEED_CHUNK = 5000
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(db_dir, users, teams, boards, tasks, storage_options):
+    """
+    Fill db_dir with synthetic data through the batch APIs and return the
+    managers together with the ids that were created.
+    """
+    um = UserManager(os.path.join(db_dir, "users.json"), **storage_options)
+    tm = TeamManager(os.path.join(db_dir, "teams.json"), **storage_options)
+    pb = ProjectBoard(os.path.join(db_dir, "boards.json"), **storage_options)
+
+    user_ids = []
+    for start in range(0, users, SEED_CHUNK):
+        batch = [
+            {"name": f"user{i}", "display_name": f"User {i}"}
+            for i in range(start, min(users, start + SEED_CHUNK))
+        ]
+        user_ids += [r["id"] for r in json.loads(um.create_users(json.dumps(batch)))]
+
+    team_ids = []
+    for i in range(teams):
+        team_id = json.loads(tm.create_team(json.dumps({
+            "name": f"team{i}", "description": f"Team {i}", "admin": random.choice(user_ids)
+        })))["id"]
+        members = random.sample(user_ids, min(len(user_ids), 20))
+        tm.add_users_to_team(json.dumps({"id": team_id, "users": members}))
+        team_ids.append(team_id)
+
+    board_ids = []
+    for i in range(boards):
+        board_ids.append(json.loads(pb.create_board(json.dumps({
+            "name": f"board{i}", "description": f"Board {i}", "team_id": team_ids[i % len(team_ids)]
+        })))["id"])
+
+    task_ids = []
+    for start in range(0, tasks, SEED_CHUNK):
+        batch = [
+            {
+                "title": f"task{i}",
+                "description": f"Synthetic task {i}",
+                "user_id": random.choice(user_ids),
+                "board_id": board_ids[i % len(board_ids)]
+            }
+            for i in range(start, min(tasks, start + SEED_CHUNK))
+        ]
+        task_ids += [r["id"] for r in json.loads(pb.add_tasks(json.dumps(batch)))]
+
+    return (um, tm, pb), {"users": user_ids, "teams": team_ids, "boards": board_ids, "tasks": task_ids}
+
+
+def cases(um, tm, pb, ids, calls):
+    """
+    (name, function, request factory) for every API method. A factory maps
+    the call number to the request; None means the method takes no request.
+    """
+    pick = random.choice
+    tag = f"{time.time_ns()}"
+    # boards without tasks, so close_board always succeeds
+    empty_boards = [
+        json.loads(pb.create_board(json.dumps({
+            "name": f"empty{tag}-{i}", "description": "", "team_id": pick(ids["teams"])
+        })))["id"]
+        for i in range(calls)
+    ]
+
+    def task_request(i):
+        return json.dumps({
+            "title": f"bench{tag}-{i}", "description": "Benchmark task",
+            "user_id": pick(ids["users"]), "board_id": pick(ids["boards"])
+        })
+
+    return [
+        ("create_user", um.create_user,
+            lambda i: json.dumps({"name": f"bench{tag}-{i}", "display_name": "Bench"})),
+        ("create_users", um.create_users,
+            lambda i: json.dumps([{"name": f"bulk{tag}-{i}-{j}", "display_name": "Bench"} for j in range(100)])),
+        ("list_users", um.list_users, None),
+        ("describe_user", um.describe_user, lambda i: json.dumps({"id": pick(ids["users"])})),
+        ("update_user", um.update_user,
+            lambda i: json.dumps({"id": ids["users"][0], "user": {"name": "user0", "display_name": f"User {i}"}})),
+        ("get_user_teams", um.get_user_teams, lambda i: json.dumps({"id": pick(ids["users"])})),
+        ("create_team", tm.create_team,
+            lambda i: json.dumps({"name": f"bench{tag}-{i}", "description": "", "admin": pick(ids["users"])})),
+        ("list_teams", tm.list_teams, None),
+        ("describe_team", tm.describe_team, lambda i: json.dumps({"id": pick(ids["teams"])})),
+        ("update_team", tm.update_team,
+            lambda i: json.dumps({"id": ids["teams"][0], "team": {"name": "team0", "description": f"{i}", "admin": ""}})),
+        ("add_users_to_team", tm.add_users_to_team,
+            lambda i: json.dumps({"id": pick(ids["teams"]), "users": [pick(ids["users"])]})),
+        ("remove_users_from_team", tm.remove_users_from_team,
+            lambda i: json.dumps({"id": pick(ids["teams"]), "users": [pick(ids["users"])]})),
+        ("list_team_users", tm.list_team_users, lambda i: json.dumps({"id": pick(ids["teams"])})),
+        ("create_board", pb.create_board,
+            lambda i: json.dumps({"name": f"bench{tag}-{i}", "description": "", "team_id": pick(ids["teams"])})),
+        ("add_task", pb.add_task, task_request),
+        ("add_tasks", pb.add_tasks,
+            lambda i: "[" + ", ".join(task_request(f"{i}-{j}") for j in range(100)) + "]"),
+        ("update_task_status", pb.update_task_status,
+            lambda i: json.dumps({"id": pick(ids["tasks"]), "status": pick(["OPEN", "IN_PROGRESS", "COMPLETE"])})),
+        ("update_task_statuses", pb.update_task_statuses,
+            lambda i: json.dumps([{"id": pick(ids["tasks"]), "status": "IN_PROGRESS"} for _ in range(100)])),
+        ("list_boards", pb.list_boards, lambda i: json.dumps({"id": pick(ids["teams"])})),
+        ("board_summary", pb.board_summary, lambda i: json.dumps({"id": pick(ids["boards"])})),
+        ("team_summary", pb.team_summary, lambda i: json.dumps({"id": pick(ids["teams"])})),
+        ("search_tasks", pb.search_tasks,
+            lambda i: json.dumps({"query": f"synthetic task{random.randrange(len(ids['tasks']))}"})),
+        ("list_user_tasks", pb.list_user_tasks, lambda i: json.dumps({"id": pick(ids["users"])})),
+        ("export_board", pb.export_board, lambda i: json.dumps({"id": pick(ids["boards"])})),
+        ("export_boards", pb.export_boards,
+            lambda i: json.dumps({"team_id": pick(ids["teams"]), "format": pick(["txt", "csv", "jsonl"])})),
+        ("close_board", pb.close_board, lambda i: json.dumps({"id": empty_boards[i]})),
+    ]
+
+
+def measure(function, make_request, calls, trace_memory):
+    requests = [make_request(i) if make_request else None for i in range(calls)]
+    latencies = []
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    for request in requests:
+        t0 = time.perf_counter()
+        if request is None:
+            function()
+        else:
+            function(request)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "calls": calls,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p90_ms": _percentile(latencies, 0.90) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "throughput_per_s": calls / elapsed if elapsed else None,
+        "peak_memory_mb": peak,
+    }
+
+
+def run(args):
+    storage_options = {
+        "journal": args.journal, "backend": args.backend, "encoding": args.encoding, "cache": not args.no_cache
+    }
+    if args.flush_interval is not None:
+        storage_options["flush_interval"] = args.flush_interval
+
+    workdir = tempfile.mkdtemp(prefix="planner-bench-")
+    cwd = os.getcwd()
+    # export_board writes to out/ relative to the working directory
+    os.chdir(workdir)
+    try:
+        random.seed(args.seed)
+        t0 = time.perf_counter()
+        (um, tm, pb), ids = seed(
+            os.path.join(workdir, "db"), args.users, args.teams, args.boards, args.tasks, storage_options
+        )
+        seed_seconds = time.perf_counter() - t0
+
+        if args.instrument:
+            instrumentation.enable()
+        results = {}
+        for name, function, make_request in cases(um, tm, pb, ids, args.calls):
+            if args.only and name not in args.only:
+                continue
+            results[name] = measure(function, make_request, args.calls, args.trace_memory)
+            print(f"{name:24} p50 {results[name]['p50_ms']:9.3f} ms  p99 {results[name]['p99_ms']:9.3f} ms  "
+                  f"{results[name]['throughput_per_s']:10.1f} calls/s")
+        pb.flush()
+    finally:
+        instrumentation.disable()
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "sizes": {"users": args.users, "teams": args.teams, "boards": args.boards, "tasks": args.tasks},
+        "storage": storage_options,
+        "seed_seconds": seed_seconds,
+        "peak_rss_mb": _peak_rss_mb(),
+        "db_dir": workdir if args.keep else None,
+        "methods": results,
+        "instrumentation": instrumentation.stats() if args.instrument else None,
+        "response_cache": responses.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the planner APIs at a given data size")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--teams", type=int, default=100)
+    parser.add_argument("--boards", type=int, default=500)
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=200, help="calls per method")
+    parser.add_argument("--backend", choices=["json", "sqlite", "mmap"], default="json")
+    parser.add_argument("--journal", action="store_true")
+    parser.add_argument("--encoding", choices=["json", "json-min", "binary"], default=None,
+                        help="on-disk encoding of the JSON backend")
+    parser.add_argument("--flush-interval", type=float, default=None, help="enable group commit")
+    parser.add_argument("--trace-memory", action="store_true", help="track peak allocations per method (slower)")
+    parser.add_argument("--instrument", action="store_true", help="record per-method phase and I/O stats")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache of the read methods")
+    parser.add_argument("--only", nargs="*", help="only run these methods")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded db directory")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Response cache for the read methods of UserManager, TeamManager and ProjectBoard.
+
+A cached method's JSON response is kept under (method, request), so asking
+the same question twice returns the same string without reading the
+collection or serializing again. Each entry is tagged with the parts of the
+data it was built from, as (collection, scope) pairs: scope None stands for
+the collection as a whole (e.g. list_teams), any other value for the records
+of one team or board. A write invalidates the tags it touches, so update_team
+drops that team's describe_team and the team listings, and nothing else.
+
+Writes made by other processes are caught by the collection instead: every
+lookup first revalidates the collection the method reads, and an entry
+built at an older collection generation is dropped, see Collection.generation.
+
+The cache is shared by every manager of the process, like the collections
+themselves, and keeps the most recently used entries up to maxsize.
+"""
+import functools
+import json
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (response, tags, generation)
+        self._tagged = {}  # tag -> keys of the entries carrying it
+        # bumped by every invalidation, a response computed across one is not stored
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    # the response stored under key, if it was built at this generation of its collection
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] != generation:
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def epoch(self):
+        return self._epoch
+
+    # store response unless something was invalidated since epoch() was read
+    def put(self, key, response, tags, epoch, generation):
+        with self._lock:
+            if epoch != self._epoch or self.maxsize <= 0:
+                return
+            self._drop(key)
+            self._entries[key] = (response, tags, generation)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self._tagged.get(tag)
+            keys.discard(key)
+            if not keys:
+                del self._tagged[tag]
+
+    def invalidate(self, collection, *scopes):
+        """
+        Drop the entries built from collection as a whole and those built from
+        the given scopes of it. Without scopes every entry of the collection goes.
+        """
+        with self._lock:
+            self._epoch += 1
+            if scopes:
+                tags = [(collection, None)] + [(collection, scope) for scope in scopes]
+            else:
+                tags = [tag for tag in self._tagged if tag[0] is collection]
+            for tag in tags:
+                for key in list(self._tagged.get(tag, ())):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._tagged.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+# shared by every manager of the process
+responses = ResponseCache()
+
+
+def cached(collection, tags):
+    """
+    Cache the responses of a manager read method taking one JSON request.
+    collection names the manager attribute holding the collection the method
+    reads, so managers of different db directories don't share entries; it
+    is revalidated on every call, cached or not.
+    tags(manager, data) returns the (collection, scope) pairs of the response,
+    data being the parsed request ({} without one). Errors are not cached, and
+    managers created with cache=False bypass the cache.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            source = getattr(self, collection)
+            source.revalidate()
+            if not self.cache:
+                return method(self, *args)
+            generation = source.generation
+            key = (method.__qualname__, source) + args
+            response = responses.get(key, generation)
+            if response is not None:
+                return response
+            epoch = responses.epoch()
+            response = method(self, *args)
+            data = json.loads(args[0]) if args and args[0] is not None else {}
+            responses.put(key, response, tags(self, data), epoch, generation)
+            return response
+        return wrapper
+    return decorate
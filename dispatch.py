@@ -0,0 +1,125 @@
+"""
+Every public API method by name, behind one Dispatcher, for the front ends
+that take calls as data: server.py (HTTP) and main.py --batch.
+
+A Dispatcher owns one UserManager, TeamManager and ProjectBoard over a db
+directory. Reads run concurrently straight on the managers, which serve
+them from memory; writes go one at a time through the dispatcher's write
+lock, so their validation always sees the writes before them.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+from project_board import ProjectBoard
+from storage import deferred_writes, discard_all
+from team import TeamManager
+from user import UserManager
+
+# method name -> (manager, whether it writes the db)
+METHODS = {
+    "create_user": ("users", True),
+    "create_users": ("users", True),
+    "list_users": ("users", False),
+    "describe_user": ("users", False),
+    "update_user": ("users", True),
+    "get_user_teams": ("users", False),
+    "create_team": ("teams", True),
+    "list_teams": ("teams", False),
+    "describe_team": ("teams", False),
+    "update_team": ("teams", True),
+    "add_users_to_team": ("teams", True),
+    "remove_users_from_team": ("teams", True),
+    "list_team_users": ("teams", False),
+    "create_board": ("boards", True),
+    "close_board": ("boards", True),
+    "add_task": ("boards", True),
+    "add_tasks": ("boards", True),
+    "update_task_status": ("boards", True),
+    "update_task_statuses": ("boards", True),
+    "list_boards": ("boards", False),
+    "board_summary": ("boards", False),
+    "team_summary": ("boards", False),
+    "search_tasks": ("boards", False),
+    "list_user_tasks": ("boards", False),
+    # only write files under out/
+    "export_board": ("boards", False),
+    "export_boards": ("boards", False),
+}
+
+# methods that can be called without a request
+NO_REQUEST = {"list_users", "list_teams"}
+
+# methods whose request is a JSON array, every other one takes an object
+LIST_REQUESTS = {"create_users", "add_tasks", "update_task_statuses"}
+
+
+# what the managers raise for a request they refuse, anything else is a bug
+API_ERRORS = (ValueError, KeyError, RuntimeError)
+
+
+# the message a failed call is answered with
+def error_message(error):
+    if isinstance(error, KeyError):
+        return f"Missing required field: {error}"
+    return str(error)
+
+
+class Dispatcher:
+
+    def __init__(self, db_dir="db", **storage_options):
+        self.managers = {
+            "users": UserManager(os.path.join(db_dir, "users.json"), **storage_options),
+            "teams": TeamManager(os.path.join(db_dir, "teams.json"), **storage_options),
+            "boards": ProjectBoard(os.path.join(db_dir, "boards.json"), **storage_options),
+        }
+        self.write_lock = threading.RLock()
+
+    def call(self, method: str, request: str = None) -> str:
+        """
+        Run method with its JSON request (None for the methods that take
+        none) and return its JSON response. Unknown methods and invalid
+        requests raise ValueError, the managers' own API_ERRORS go through.
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown method {method}")
+        if request is None and method not in NO_REQUEST:
+            raise ValueError(f"{method} needs a request")
+        if request is not None:
+            # a request of the wrong shape, e.g. [1] to create_user, would fail somewhere in the manager
+            expected = "[" if method in LIST_REQUESTS else "{"
+            if request.lstrip()[:1] != expected:
+                kind = "array" if method in LIST_REQUESTS else "object"
+                raise ValueError(f"{method} needs a JSON {kind} request")
+        manager, writes = METHODS[method]
+        function = getattr(self.managers[manager], method)
+        args = () if request is None else (request,)
+        if not writes:
+            return function(*args)
+        with self.write_lock:
+            return function(*args)
+
+    @contextmanager
+    def group(self):
+        """
+        Hold the write lock and keep the disk writes of every call made inside
+        in memory, then write each touched file once when the group ends. A
+        group that ends with an exception writes nothing: its writes are
+        dropped and the files they touched reloaded, as if it never ran.
+        JSON backend only, sqlite and mmap write and keep every call. Under
+        group commit (flush_interval) the background flush may still write
+        part of a group before it fails.
+        """
+        with self.write_lock:
+            # writes deferred before the group aren't the group's to drop
+            self.flush()
+            with deferred_writes():
+                try:
+                    yield
+                except BaseException:
+                    discard_all()
+                    raise
+            self.flush()
+
+    def flush(self):
+        self.managers["boards"].flush()
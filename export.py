@@ -0,0 +1,145 @@
+import csv
+import io
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+EXPORT_FORMATS = ("txt", "csv", "jsonl")
+EXPORT_DIR = "out"
+
+# tasks rendered per write to the out file
+CHUNK_TASKS = 1000
+
+# (jobs, fmt) of the export a worker process was started for, see write_boards
+_shared = None
+
+CSV_COLUMNS = ("board_id", "board_name", "task_id", "title", "description", "status", "user_id", "creation_time")
+
+
+def check_format(fmt):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid format {fmt}, must be one of {', '.join(EXPORT_FORMATS)}")
+
+
+def export_path(board_id, fmt):
+    return f"{EXPORT_DIR}/board_{board_id}.{fmt}"
+
+
+def _txt_header(out, board):
+    out.write(f"Board: {board['name']}\n")
+    out.write(f"Description: {board['description']}\n")
+    out.write(f"Team ID: {board['team_id']}\n")
+    out.write(f"Status: {board['status']}\n")
+    out.write(f"Created: {board['creation_time']}\n")
+    if "end_time" in board:
+        out.write(f"Closed: {board['end_time']}\n")
+    out.write("\nTasks:\n")
+
+
+def _txt_task(out, board, task):
+    out.write(
+        f"  - {task['title']} [{task['status']}]\n"
+        f"    Description: {task['description']}\n"
+        f"    Assigned to: {task['user_id']}\n"
+        f"    Created: {task['creation_time']}\n\n"
+    )
+
+
+def _jsonl_header(out, board):
+    out.write(json.dumps(dict(board)) + "\n")
+
+
+def _jsonl_task(out, board, task):
+    out.write(json.dumps(dict(task, board_id=board["id"])) + "\n")
+
+
+def _csv_header(out, board):
+    csv.writer(out).writerow(CSV_COLUMNS)
+
+
+def _csv_task(out, board, task):
+    csv.writer(out).writerow((
+        board["id"], board["name"], task["id"], task["title"], task["description"],
+        task["status"], task["user_id"], task["creation_time"],
+    ))
+
+
+_RENDERERS = {
+    "txt": (_txt_header, _txt_task),
+    "csv": (_csv_header, _csv_task),
+    "jsonl": (_jsonl_header, _jsonl_task),
+}
+
+
+def write_board(board, tasks, fmt="txt"):
+    """
+    Write one board and its tasks to out/board_<id>.<fmt> and return the path.
+
+    tasks may be any iterable, e.g. a storage iterator: it is consumed once and
+    rendered CHUNK_TASKS at a time, so a board of any size is written in a few
+    large writes without holding the whole file in memory.
+    """
+    check_format(fmt)
+    header, render = _RENDERERS[fmt]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    filename = export_path(board["id"], fmt)
+    # rendered into memory and written out a chunk at a time
+    chunk = io.StringIO()
+    header(chunk, board)
+    with open(filename, "w", newline="") as f:
+        for count, task in enumerate(tasks, 1):
+            render(chunk, board, task)
+            if count % CHUNK_TASKS == 0:
+                f.write(chunk.getvalue())
+                chunk = io.StringIO()
+        f.write(chunk.getvalue())
+    return filename
+
+
+def _init_worker(jobs, fmt):
+    global _shared
+    _shared = (jobs, fmt)
+
+
+def _write_shared(index):
+    jobs, fmt = _shared
+    board, tasks = jobs[index]
+    return write_board(board, tasks, fmt)
+
+
+def pool_available():
+    """
+    Whether write_boards can use worker processes here: only in a process that
+    can fork and runs no other thread, e.g. main.py or a batch run. The server
+    handles every request on a thread of its own and the async facade keeps
+    an executor, so there an export always renders in the calling thread.
+    """
+    return "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1
+
+
+def write_boards(jobs, fmt="txt", workers=1):
+    """
+    Write every (board, tasks) pair of jobs, on up to `workers` processes,
+    and return the out files in the order of jobs.
+
+    The workers are forked and handed jobs when they start, so they inherit
+    the data as it is, parsed once in this process and never pickled, and
+    each call's pool only ever sees its own jobs. Forking is only safe while this
+    process runs no other thread: a child inherits the other threads' locks
+    in whatever state they are in. Where that doesn't hold (see
+    pool_available) the boards are written by this process; sending the
+    jobs to fresh processes costs about as much as rendering them.
+    """
+    check_format(fmt)
+    if workers <= 1 or len(jobs) <= 1 or not pool_available():
+        return [write_board(board, tasks, fmt) for board, tasks in jobs]
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    workers = min(workers, len(jobs))
+    # a few chunks per worker keeps them busy when board sizes differ
+    chunksize = max(1, len(jobs) // (workers * 4))
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(jobs, fmt)) as pool:
+        return list(pool.map(_write_shared, range(len(jobs)), chunksize=chunksize))
@@ -0,0 +1,189 @@
+"""
+Opt-in per call instrumentation of UserManager, TeamManager and ProjectBoard.
+
+    import instrumentation
+    instrumentation.enable()            # or enable(profile=True) to also run cProfile
+    ...
+    print(instrumentation.stats())
+    instrumentation.disable()
+
+enable() wraps every public manager method. For each method it records the
+number of calls and errors, a latency histogram, the bytes read from and
+written to the db, and the time split into phases: "load" (reading and
+parsing db files), "dump" (serializing and writing them) and "scan"
+(everything else: lookups, filtering, building the response).
+
+While disabled the manager classes are left untouched and the storage layer
+only pays a flag check, so there is no measurable cost.
+"""
+import cProfile
+import functools
+import io
+import pstats
+import threading
+import time
+
+# upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, float("inf"))
+
+enabled = False
+
+_stats = {}
+_stats_lock = threading.Lock()
+_local = threading.local()
+_originals = []
+_profiler = None
+
+
+def _new_entry():
+    return {
+        "calls": 0,
+        "errors": 0,
+        "total_ms": 0.0,
+        "histogram_ms": [0] * len(BUCKETS_MS),
+        "bytes_read": 0,
+        "bytes_written": 0,
+        "phases_ms": {"load": 0.0, "scan": 0.0, "dump": 0.0},
+    }
+
+
+def record_io(phase, started, nbytes):
+    """
+    Called by the storage layer after a load or dump that began at
+    time.perf_counter() == started and moved nbytes bytes.
+    """
+    if not enabled:
+        return
+    elapsed = time.perf_counter() - started
+    calls = getattr(_local, "calls", None)
+    if calls:
+        current = calls[-1]
+    else:
+        # I/O outside an API call: opening a manager, a group commit flush
+        current = {"name": "(background)", "load": 0.0, "dump": 0.0, "bytes_read": 0, "bytes_written": 0}
+    current[phase] += elapsed
+    current["bytes_read" if phase == "load" else "bytes_written"] += nbytes
+    if not calls:
+        _finish(current, elapsed, failed=False, count=False)
+
+
+def _finish(call, elapsed, failed, count=True):
+    with _stats_lock:
+        entry = _stats.setdefault(call["name"], _new_entry())
+        if count:
+            entry["calls"] += 1
+            entry["errors"] += failed
+            entry["total_ms"] += elapsed * 1000
+            for i, bound in enumerate(BUCKETS_MS):
+                if elapsed * 1000 <= bound:
+                    entry["histogram_ms"][i] += 1
+                    break
+            entry["phases_ms"]["scan"] += max(0.0, elapsed - call["load"] - call["dump"]) * 1000
+        entry["phases_ms"]["load"] += call["load"] * 1000
+        entry["phases_ms"]["dump"] += call["dump"] * 1000
+        entry["bytes_read"] += call["bytes_read"]
+        entry["bytes_written"] += call["bytes_written"]
+
+
+def _wrap(name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        calls = getattr(_local, "calls", None)
+        if calls is None:
+            calls = _local.calls = []
+        call = {"name": name, "load": 0.0, "dump": 0.0, "bytes_read": 0, "bytes_written": 0}
+        calls.append(call)
+        started = time.perf_counter()
+        failed = True
+        try:
+            # only the outermost call is profiled, cProfile can't be nested
+            if _profiler is not None and len(calls) == 1:
+                result = _profiler.runcall(method, *args, **kwargs)
+            else:
+                result = method(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            calls.pop()
+            _finish(call, time.perf_counter() - started, failed)
+
+    return wrapper
+
+
+def enable(profile=False):
+    """
+    Start recording. With profile=True every outermost API call also runs
+    under one shared cProfile profiler, see profile_report().
+    """
+    global enabled, _profiler
+    from project_board import ProjectBoard
+    from team import TeamManager
+    from user import UserManager
+
+    if profile and _profiler is None:
+        _profiler = cProfile.Profile()
+    if enabled:
+        return
+    for cls in (UserManager, TeamManager, ProjectBoard):
+        for attr, method in list(vars(cls).items()):
+            if attr.startswith("_") or not callable(method):
+                continue
+            _originals.append((cls, attr, method))
+            setattr(cls, attr, _wrap(f"{cls.__name__}.{attr}", method))
+    enabled = True
+
+
+def disable():
+    """
+    Stop recording and restore the original methods. Collected stats are kept.
+    """
+    global enabled, _profiler
+    while _originals:
+        cls, attr, method = _originals.pop()
+        setattr(cls, attr, method)
+    enabled = False
+    _profiler = None
+
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
+    if _profiler is not None:
+        _profiler.clear()
+
+
+def stats():
+    """
+    Snapshot of what was recorded, keyed by "Class.method". Histogram
+    buckets are keyed by their upper bound in milliseconds.
+    """
+    with _stats_lock:
+        snapshot = {}
+        for name, entry in _stats.items():
+            snapshot[name] = dict(entry)
+            snapshot[name]["phases_ms"] = dict(entry["phases_ms"])
+            snapshot[name]["histogram_ms"] = {
+                ("inf" if bound == float("inf") else str(bound)): count
+                for bound, count in zip(BUCKETS_MS, entry["histogram_ms"])
+                if count
+            }
+        return snapshot
+
+
+def profile_report(limit=30, sort="cumulative"):
+    """
+    Text report of the cProfile data gathered since enable(profile=True).
+    """
+    if _profiler is None:
+        return ""
+    out = io.StringIO()
+    pstats.Stats(_profiler, stream=out).sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def dump_profile(path):
+    """
+    Write the cProfile data in pstats format, for snakeviz and friends.
+    """
+    if _profiler is not None:
+        _profiler.dump_stats(path)
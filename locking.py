@@ -0,0 +1,65 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, locking is then per process only
+    fcntl = None
+
+
+class FileLock:
+    """
+    Reader/writer lock shared between processes through flock() on a lock file.
+
+    Any number of processes can hold the shared lock at once, the exclusive
+    lock waits for all of them. Threads of one process are serialized by a
+    re-entrant lock first, because flock() locks belong to the open file and
+    would otherwise be shared by every thread. Nested acquisitions from the
+    same thread are free and keep the outermost mode.
+
+    A forked child opens the lock file again: an inherited descriptor shares
+    its flock() with the parent, so it would exclude neither of them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._fd = None
+        self._pid = None
+        self._depth = 0
+
+    @contextmanager
+    def _acquire(self, mode):
+        with self._thread_lock:
+            if self._depth == 0 and fcntl is not None:
+                if self._fd is None or self._pid != os.getpid():
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                    self._pid = os.getpid()
+                fcntl.flock(self._fd, mode)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0 and fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def shared(self):
+        return self._acquire(fcntl.LOCK_SH if fcntl else None)
+
+    def exclusive(self):
+        return self._acquire(fcntl.LOCK_EX if fcntl else None)
+
+
+def atomic_write(path, data):
+    """
+    Replace path with data (str or bytes) so that readers see either the old or
+    the new file, never a truncated one, even if the process dies half way.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -1,7 +1,11 @@
 from user import UserManager
 from team import TeamManager
 from project_board import ProjectBoard
+from dispatch import API_ERRORS, Dispatcher, error_message
+from contextlib import ExitStack
+import argparse
 import json
+import sys
 
 
 def user_menu():
@@ -206,5 +210,93 @@ def main():
             print(f"Error: {e}")
 
 
+def run_batch(lines, out, dispatcher):
+    """
+    Run a stream of JSON Lines commands, {"method": ..., "request": ...},
+    and write one JSON line per command to out as it completes:
+    {"line": n, "result": <response>} or {"line": n, "error": "..."}.
+    request is the method's request as JSON (or as a JSON string), left out
+    for the methods that take none. {"method": "group"} ... {"method": "flush"}
+    groups the writes in between into one disk write per file, see
+    Dispatcher.group. A group is all or nothing: the first command of it that
+    fails rolls the whole group back, and the commands after it up to the
+    flush are answered with an error without being run. Returns the number
+    of failed commands.
+    """
+    failed = 0
+    group = ExitStack()
+    grouped = False
+    # line of the command that rolled back the group not flushed yet
+    rolled_back = None
+    with group:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                command = json.loads(line)
+                if not isinstance(command, dict):
+                    raise ValueError("A command must be a JSON object")
+                method = command["method"]
+                if rolled_back is not None:
+                    if method == "flush":
+                        line_failed, rolled_back = rolled_back, None
+                        raise ValueError(f"Nothing written, the group was rolled back at line {line_failed}")
+                    raise ValueError(f"Skipped, the group was rolled back at line {rolled_back}")
+                if method == "group":
+                    if grouped:
+                        raise ValueError("A group is already open")
+                    group.enter_context(dispatcher.group())
+                    grouped = True
+                    result = None
+                elif method == "flush":
+                    if not grouped:
+                        raise ValueError("No group to flush")
+                    group.close()
+                    grouped = False
+                    result = None
+                else:
+                    request = command.get("request")
+                    if request is not None and not isinstance(request, str):
+                        request = json.dumps(request)
+                    result = json.loads(dispatcher.call(method, request))
+            except Exception as e:
+                failed += 1
+                if isinstance(e, API_ERRORS):
+                    message = error_message(e)
+                else:
+                    # a bug, still answered so the rest of the batch runs
+                    message = f"{type(e).__name__}: {e}"
+                out.write(json.dumps({"line": number, "error": message}) + "\n")
+                if grouped:
+                    # ends the group with the error, which rolls it back
+                    group.__exit__(type(e), e, e.__traceback__)
+                    grouped = False
+                    rolled_back = number
+            else:
+                out.write(json.dumps({"line": number, "result": result}) + "\n")
+    out.flush()
+    return failed
+
+
+def batch_main(args):
+    storage_options = {"journal": args.journal, "backend": args.backend}
+    dispatcher = Dispatcher(args.db_dir, **storage_options)
+    if args.batch == "-":
+        failed = run_batch(sys.stdin, sys.stdout, dispatcher)
+    else:
+        with open(args.batch) as f:
+            failed = run_batch(f, sys.stdout, dispatcher)
+    dispatcher.flush()
+    return 1 if failed else 0
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Project management system, interactive or in batch")
+    parser.add_argument("--batch", metavar="FILE", help="run the JSON Lines commands of FILE (- for stdin)")
+    parser.add_argument("--db-dir", default="db")
+    parser.add_argument("--backend", choices=["json", "sqlite", "mmap"], default="json")
+    parser.add_argument("--journal", action="store_true")
+    args = parser.parse_args()
+    if args.batch:
+        sys.exit(batch_main(args))
     main()
@@ -0,0 +1,70 @@
+"""
+Setup shared by UserManager, TeamManager and ProjectBoard: where their db
+lives, how its collections are stored and whether read responses are cached.
+"""
+import os
+
+from records import Team, User
+from storage import flush_all, open_collection
+
+
+class StoredManager:
+    """
+    Base of the managers. db_path is the manager's own db file, the other
+    collections it opens live next to it.
+
+    The storage options apply to every collection the manager opens, see
+    storage.open_collection: the backend ("json", "sqlite" or "mmap"),
+    journal mode, group commit (flush_interval seconds, flush_size
+    operations) and the snapshot encoding. cache=False keeps the manager's
+    read responses out of the response cache, see cache.py.
+    """
+
+    def __init__(self, db_path, journal=False, backend="json", flush_interval=None, flush_size=1000,
+                 encoding=None, cache=True):
+        self.db_path = db_path
+        self.backend = backend
+        # how every collection this manager opens is stored, see storage.open_collection
+        self.storage_options = {
+            "journal": journal,
+            "backend": backend,
+            "flush_interval": flush_interval,
+            "flush_size": flush_size,
+            "encoding": encoding
+        }
+        # keep read responses in the process wide cache, see cache.py
+        self.cache = cache
+
+    # path of a db file next to this manager's, e.g. "teams.json"
+    def _db_file(self, name):
+        return os.path.join(os.path.dirname(self.db_path), name)
+
+    # open a collection with this manager's storage options, options override them
+    def _open(self, path, **options):
+        return open_collection(path, **dict(self.storage_options, **options))
+
+    # the users collection with all of its indexes. UserManager writes it, TeamManager reads it;
+    # both register every index, since the sqlite backend keeps them in tables its writers maintain
+    def _open_users(self, path):
+        users = self._open(path, record_type=User)
+        users.add_index("name", lambda user: user["name"], unique=True)
+        # ordered indexes behind the paginated list_users
+        users.add_index("name_order", lambda user: user["name"], ordered=True)
+        users.add_index("created", lambda user: user.get("creation_time"), ordered=True)
+        return users
+
+    # the teams collection with all of its indexes, see _open_users
+    def _open_teams(self, path):
+        teams = self._open(path, record_type=Team)
+        # team names are unique case-insensitively
+        teams.add_index("name", lambda team: team["name"].lower(), unique=True)
+        # ordered indexes behind the paginated list_teams
+        teams.add_index("name_order", lambda team: team["name"], ordered=True)
+        teams.add_index("created", lambda team: team.get("creation_time"), ordered=True)
+        # reverse membership: user id -> teams listing that user
+        teams.add_index("member", lambda team: team.get("users", []), multi=True)
+        return teams
+
+    # write out every change still held back by group commit (flush_interval)
+    def flush(self):
+        flush_all()
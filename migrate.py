@@ -0,0 +1,63 @@
+"""
+Convert every JSON collection of a db directory to another on-disk encoding.
+
+    python migrate.py --encoding binary            # db/ in place
+    python migrate.py --encoding json --db path/to/db
+
+Covers every collection of the db directory (users.json, teams.json,
+boards.json, the task and search indexes, meta.json) and the per board
+files under tasks/ and task_counts/. Each file is rewritten atomically under its lock,
+with any journal folded in, so it is safe while the planner is running;
+files in any encoding are read either way. The planner keeps writing each
+file in the encoding it finds, unless a manager is given encoding=....
+"""
+import argparse
+import glob
+import os
+
+from storage import ENCODINGS, JsonCollection
+
+
+def collection_files(db_dir):
+    return sorted(
+        glob.glob(os.path.join(db_dir, "*.json"))
+        + glob.glob(os.path.join(db_dir, "tasks", "*.json"))
+        + glob.glob(os.path.join(db_dir, "task_counts", "*.json"))
+    )
+
+
+# bytes a collection takes on disk, its snapshot and journal
+def collection_size(path):
+    return sum(os.path.getsize(p) for p in (path, path + ".log") if os.path.exists(p))
+
+
+def migrate(db_dir, encoding):
+    """
+    Rewrite every collection file of db_dir in encoding and return
+    (path, bytes before, bytes after) for each, counting its journal.
+    """
+    results = []
+    for path in collection_files(db_dir):
+        before = collection_size(path)
+        collection = JsonCollection(path, encoding=encoding)
+        collection.compact()
+        results.append((path, before, collection_size(path)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the db files to another on-disk encoding")
+    parser.add_argument("--encoding", choices=ENCODINGS, required=True)
+    parser.add_argument("--db", default="db", help="db directory (default: db)")
+    args = parser.parse_args()
+
+    total_before = total_after = 0
+    for path, before, after in migrate(args.db, args.encoding):
+        total_before += before
+        total_after += after
+        print(f"{path}: {before} -> {after} bytes")
+    print(f"Total: {total_before} -> {total_after} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,446 @@
+import json
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+import instrumentation
+from locking import FileLock, atomic_write
+from storage import Collection, JsonCollection, _Index, _SortedIndex, apply_change
+
+REC_MAGIC = b"PLANNERREC1\n"
+IDX_MAGIC = b"PLANNERIDX1\n"
+# generation of a record file, changes whenever it is rewritten
+_REC_HEADER = struct.Struct("<Q")
+REC_START = len(REC_MAGIC) + _REC_HEADER.size
+# payload length and id length of a record entry, followed by the id and the JSON payload
+_ENTRY = struct.Struct("<IH")
+# generation of the record file it indexes, rec file size it covers,
+# records in it, entries (live or superseded) in it
+_IDX_HEADER = struct.Struct("<QQQQ")
+IDX_START = len(IDX_MAGIC) + _IDX_HEADER.size
+# record id (NUL padded) and offset of its latest entry
+_SLOT = struct.Struct("<64sQ")
+MAX_ID_BYTES = 64
+
+
+def _id_key(record_id):
+    return record_id.encode().ljust(MAX_ID_BYTES, b"\0")
+
+
+def _entry(record):
+    record_id = record["id"].encode()
+    payload = json.dumps(record, separators=(",", ":")).encode()
+    return _ENTRY.pack(len(payload), len(record_id)) + record_id + payload
+
+
+# id, payload start and end of the entry at pos
+def _entry_at(rec, pos):
+    size, id_size = _ENTRY.unpack_from(rec, pos)
+    start = pos + _ENTRY.size + id_size
+    return rec[pos + _ENTRY.size:start].decode(), start, start + size
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else None
+
+
+class MmapCollection(Collection):
+    """
+    Collection stored as an append-only record file read through mmap.
+
+    "<name>.rec" holds length-prefixed JSON records; a write appends the new
+    version of a record and never touches the old one. "<name>.idx" is an
+    array of fixed size (id, offset) slots sorted by id, so a lookup is a
+    binary search on the mapped file: get() touches a handful of pages
+    whatever the size of the collection, and every process shares those
+    pages through the OS page cache. Records written after the index was
+    last rebuilt are found through a small in-memory id -> offset tail,
+    which is folded into a new index file every `compact_every` writes. The
+    record file is rewritten without superseded versions once they make up
+    more than half of it.
+
+    Secondary indexes keep only keys and ids in memory. They are built on
+    first use, all of them in one pass over the file.
+
+    Transactions work like JsonCollection's: an exclusive flock on
+    "<name>.rec.lock", a catch up on entries other processes appended, and
+    the records written inside are appended in one write when the outermost
+    transaction exits, or dropped if it raises. Until then only the thread
+    running the transaction reads them. As with the journal mode,
+    the append is handed to the OS, not fsync'd. Ids are limited to
+    MAX_ID_BYTES bytes.
+    """
+
+    def __init__(self, path, shard=None, compact_every=1000):
+        base = os.path.splitext(path)[0]
+        if shard is not None:
+            base = os.path.join(base, shard)
+        self.rec_path = base + ".rec"
+        self.idx_path = base + ".idx"
+        self.compact_every = compact_every
+        self._lock = FileLock(self.rec_path + ".lock")
+        # guards the maps and the tail against readers in other threads
+        self._mutex = threading.RLock()
+        self._depth = 0
+        self._indexes = {}
+        # registered with add_index but not built yet
+        self._new_indexes = {}
+        # records written in the open transaction, seen only by the thread running it
+        self._pending = {}
+        self._owner = None
+        self._rec_map = None
+        self._rec_ino = None
+        self._rec_end = 0
+        self._rec_generation = None
+        self._idx_map = None
+        self._idx_ino = None
+        self._idx_count = 0
+        self._covered = REC_START
+        self._entries = 0
+        self._tail = {}
+        self._count = 0
+        os.makedirs(os.path.dirname(self.rec_path) or ".", exist_ok=True)
+        with self._lock.exclusive():
+            if not os.path.exists(self.rec_path):
+                self._create(base + ".json")
+            self._refresh()
+
+    # a new record file, seeded from the JSON collection it replaces if there is one
+    def _create(self, json_path):
+        records = JsonCollection(json_path).values() if os.path.exists(json_path) else []
+        self._write_files(records)
+
+    # rewrite both files from scratch with one entry per record
+    def _write_files(self, records):
+        generation = random.getrandbits(64)
+        parts = [REC_MAGIC, _REC_HEADER.pack(generation)]
+        offsets = {}
+        offset = REC_START
+        for record in records:
+            entry = _entry(record)
+            offsets[record["id"]] = offset
+            parts.append(entry)
+            offset += len(entry)
+        atomic_write(self.rec_path, b"".join(parts))
+        # an index of another generation is ignored, so a crash in between only costs a rescan
+        self._write_index(generation, offsets, offset, len(offsets))
+
+    def _write_index(self, generation, offsets, covered, entries):
+        slots = b"".join(_SLOT.pack(_id_key(record_id), offsets[record_id]) for record_id in sorted(offsets))
+        header = _IDX_HEADER.pack(generation, covered, len(offsets), entries)
+        atomic_write(self.idx_path, IDX_MAGIC + header + slots)
+
+    def _idx_ino_now(self):
+        try:
+            return os.stat(self.idx_path).st_ino
+        except FileNotFoundError:
+            return None
+
+    # catch up with what other processes (or we) wrote
+    def _refresh(self):
+        with self._mutex:
+            rec_stat = os.stat(self.rec_path)
+            if rec_stat.st_ino != self._rec_ino:
+                self._reopen(rec_stat)
+                self.generation += 1
+                return
+
+            # new entries first, checked against the index they were appended on top of
+            if rec_stat.st_size != self._rec_end:
+                end = self._rec_end
+                self._rec_map = _map(self.rec_path)
+                self._scan(self._rec_end, rec_stat.st_size, update_indexes=True)
+                if self._rec_end != end:
+                    self.generation += 1
+
+            idx_ino = self._idx_ino_now()
+            if idx_ino != self._idx_ino:
+                self._open_index(idx_ino)
+                # what the new index covers no longer needs a tail entry
+                self._tail = {i: o for i, o in self._tail.items() if o >= self._covered}
+                self._count = self._idx_count + sum(1 for i in self._tail if self._idx_lookup(i) is None)
+                # superseded entries past the index aren't known any more, only used to decide on compaction
+                self._entries += len(self._tail)
+
+    def revalidate(self):
+        rec_stat = os.stat(self.rec_path)
+        if rec_stat.st_ino != self._rec_ino or rec_stat.st_size != self._rec_end:
+            with self._lock.shared():
+                self._refresh()
+
+    # the record file was replaced, start over from its index
+    def _reopen(self, rec_stat):
+        self._rec_map = _map(self.rec_path)
+        self._rec_ino = rec_stat.st_ino
+        if self._rec_map[:len(REC_MAGIC)] != REC_MAGIC:
+            raise ValueError(f"{self.rec_path} is not a record file")
+        (self._rec_generation,) = _REC_HEADER.unpack_from(self._rec_map, len(REC_MAGIC))
+        self._open_index(self._idx_ino_now())
+        self._tail = {}
+        self._count = self._idx_count
+        self._rec_end = self._covered
+        self._scan(self._covered, rec_stat.st_size, update_indexes=False)
+        self._rebuild_indexes()
+
+    def _open_index(self, idx_ino):
+        self._idx_ino = idx_ino
+        self._idx_map = None if idx_ino is None else _map(self.idx_path)
+        if self._idx_map is not None and self._idx_map[:len(IDX_MAGIC)] == IDX_MAGIC:
+            header = _IDX_HEADER.unpack_from(self._idx_map, len(IDX_MAGIC))
+            if header[0] == self._rec_generation:
+                self._covered, self._idx_count, self._entries = header[1:]
+                return
+        self._idx_map = None
+        self._covered, self._idx_count, self._entries = REC_START, 0, 0
+
+    # index the entries in [start, end) of the record file, a torn last entry is ignored
+    def _scan(self, start, end, update_indexes):
+        rec = self._rec_map
+        pos = start
+        update_indexes = update_indexes and self._indexes
+        while pos + _ENTRY.size <= end:
+            record_id, payload, next_pos = _entry_at(rec, pos)
+            if next_pos > end:
+                break
+            old_offset = self._offset(record_id)
+            if old_offset is None:
+                self._count += 1
+            elif update_indexes:
+                self._unindex(self._read_at(old_offset))
+            if update_indexes:
+                self._index(json.loads(rec[payload:next_pos].decode()))
+            self._tail[record_id] = pos
+            self._entries += 1
+            pos = next_pos
+        self._rec_end = pos
+
+    def _index(self, record):
+        for index in self._indexes.values():
+            index.add(record)
+
+    def _unindex(self, record):
+        for index in self._indexes.values():
+            index.remove(record)
+
+    # build every index from scratch in one pass, including those not built yet
+    def _rebuild_indexes(self):
+        with self._lock.shared(), self._mutex:
+            self._indexes.update(self._new_indexes)
+            self._new_indexes = {}
+            if self._indexes:
+                records = list(self.iter_values())
+                for index in self._indexes.values():
+                    index.rebuild(records)
+
+    def _built(self, name):
+        if self._new_indexes:
+            self._rebuild_indexes()
+        return self._indexes[name]
+
+    # offset of the latest committed entry of a record, or None
+    def _offset(self, record_id):
+        offset = self._tail.get(record_id)
+        return self._idx_lookup(record_id) if offset is None else offset
+
+    # binary search of the index file, only touches the pages it compares against
+    def _idx_lookup(self, record_id):
+        idx = self._idx_map
+        if idx is None:
+            return None
+        key = _id_key(record_id)
+        lo, hi = 0, self._idx_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            slot = IDX_START + mid * _SLOT.size
+            found = idx[slot:slot + MAX_ID_BYTES]
+            if found < key:
+                lo = mid + 1
+            elif found > key:
+                hi = mid
+            else:
+                return _SLOT.unpack_from(idx, slot)[1]
+        return None
+
+    def _read_at(self, offset):
+        started = time.perf_counter()
+        rec = self._rec_map
+        _, start, end = _entry_at(rec, offset)
+        data = rec[start:end]
+        if instrumentation.enabled:
+            instrumentation.record_io("load", started, len(data))
+        return json.loads(data.decode())
+
+    # latest committed version of a record, ignoring the open transaction
+    def _committed(self, record_id):
+        with self._mutex:
+            offset = self._offset(record_id)
+            return None if offset is None else self._read_at(offset)
+
+    def add_index(self, name, key, unique=False, multi=False, ordered=False):
+        if name in self._indexes or name in self._new_indexes:
+            return
+        self._new_indexes[name] = _SortedIndex(key) if ordered else _Index(key, unique, multi)
+
+    def __len__(self):
+        return self._count
+
+    def get(self, record_id):
+        if self._owner == threading.get_ident():
+            record = self._pending.get(record_id)
+            if record is not None:
+                return record
+        return self._committed(record_id)
+
+    def find_all(self, index, value):
+        found = (self.get(record_id) for record_id in self._built(index).ids(value))
+        return [record for record in found if record is not None]
+
+    def count(self, index, value):
+        return self._built(index).count(value)
+
+    def scan(self, index, low=None, high=None, after=None):
+        for key, record_id in self._built(index).scan(low, high, after):
+            record = self.get(record_id)
+            if record is not None:
+                yield key, record
+
+    # records in insertion order, each in its latest version
+    def iter_values(self, batch_size=1000):
+        with self._mutex:
+            rec, end = self._rec_map, self._rec_end
+        pending = self._pending if self._owner == threading.get_ident() else {}
+        # one pass over the entry headers: updating a key keeps its first position
+        latest = {}
+        pos = REC_START
+        while pos < end:
+            record_id, _, next_pos = _entry_at(rec, pos)
+            latest[record_id] = pos
+            pos = next_pos
+        for record_id, offset in latest.items():
+            record = pending.get(record_id)
+            if record is None:
+                _, start, stop = _entry_at(rec, offset)
+                record = json.loads(rec[start:stop].decode())
+            yield record
+        for record_id, record in list(pending.items()):
+            if record_id not in latest:
+                yield record
+
+    def values(self):
+        return list(self.iter_values())
+
+    def insert(self, record):
+        if len(record["id"].encode()) > MAX_ID_BYTES:
+            raise ValueError(f"Record id {record['id']} is longer than {MAX_ID_BYTES} bytes")
+        with self.transaction():
+            if self.get(record["id"]) is not None:
+                raise ValueError(f"Record {record['id']} already exists")
+            if self._new_indexes:
+                self._rebuild_indexes()
+            self._pending[record["id"]] = record
+            self._count += 1
+            self._index(record)
+        return record
+
+    def _change(self, op):
+        with self.transaction():
+            record = self.get(op["id"])
+            if record is None:
+                raise KeyError(op["id"])
+            if self._new_indexes:
+                self._rebuild_indexes()
+            self._unindex(record)
+            apply_change(record, op)
+            self._pending[record["id"]] = record
+            self._index(record)
+        return record
+
+    def update(self, record_id, fields):
+        return self._change({"op": "update", "id": record_id, "fields": fields})
+
+    def unset(self, record_id, fields):
+        return self._change({"op": "unset", "id": record_id, "fields": list(fields)})
+
+    def extend(self, record_id, field, items):
+        return self._change({"op": "extend", "id": record_id, "field": field, "items": list(items)})
+
+    @contextmanager
+    def transaction(self):
+        with self._lock.exclusive():
+            self._depth += 1
+            try:
+                if self._depth == 1:
+                    self._refresh()
+                    self._owner = threading.get_ident()
+                yield self
+                if self._depth == 1 and self._pending:
+                    self._write_pending()
+            except BaseException:
+                if self._depth == 1 and self._pending:
+                    self._rollback()
+                raise
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._owner = None
+
+    # put the indexes back to what is on disk
+    def _rollback(self):
+        pending, self._pending = self._pending, {}
+        for record_id, record in pending.items():
+            self._unindex(record)
+            committed = self._committed(record_id)
+            if committed is None:
+                self._count -= 1
+            else:
+                self._index(committed)
+        # other threads may have looked the rolled back records up in the indexes meanwhile
+        self.generation += 1
+
+    # append every record written in the transaction in one go
+    def _write_pending(self):
+        started = time.perf_counter()
+        entries = [(record_id, _entry(record)) for record_id, record in self._pending.items()]
+        data = b"".join(entry for _, entry in entries)
+        with open(self.rec_path, "r+b") as f:
+            # anything past the last complete entry is a torn write from a crash
+            f.seek(self._rec_end)
+            f.truncate()
+            f.write(data)
+            f.flush()
+        instrumentation.record_io("dump", started, len(data))
+
+        with self._mutex:
+            self._rec_map = _map(self.rec_path)
+            offset = self._rec_end
+            for record_id, entry in entries:
+                self._tail[record_id] = offset
+                offset += len(entry)
+            self._rec_end = offset
+            self._entries += len(entries)
+            self._pending = {}
+        if len(self._tail) >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """
+        Fold the tail into a new index file, and rewrite the record file
+        instead if most of it is superseded versions.
+        """
+        with self.transaction(), self._mutex:
+            if self._entries > 2 * self._count:
+                self._write_files(list(self.iter_values()))
+            else:
+                offsets = {}
+                for i in range(self._idx_count):
+                    key, offset = _SLOT.unpack_from(self._idx_map, IDX_START + i * _SLOT.size)
+                    offsets[key.rstrip(b"\0").decode()] = offset
+                offsets.update(self._tail)
+                self._write_index(self._rec_generation, offsets, self._rec_end, self._entries)
+            self._refresh()
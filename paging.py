@@ -0,0 +1,109 @@
+"""
+Filtered, cursor paginated listings over a collection's ordered indexes,
+shared by list_users, list_teams and list_boards.
+
+Every listing has two ordered indexes, one by name and one by creation time,
+whose keys start with a scope (e.g. the team of a board). A name_prefix or a
+creation time range then becomes a key range, so a page only reads the
+records it returns plus one.
+"""
+import base64
+import json
+
+# separates the parts of an ordered index key
+SEP = "\x1f"
+# sorts after any character, closes the key range of a prefix
+_HIGHEST = chr(0x10FFFF)
+# request keys that turn a list call into a list_page call
+REQUEST_KEYS = ("limit", "cursor", "fields", "name_prefix", "created_from", "created_until")
+
+
+def ordered_key(*parts):
+    return SEP.join(parts)
+
+
+def _encode_cursor(index, key, record_id):
+    raw = json.dumps([index, key, record_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        parts = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("Invalid cursor")
+    # anything but the three strings _encode_cursor wrote can't be compared with index keys
+    if not isinstance(parts, list) or len(parts) != 3 or not all(isinstance(part, str) for part in parts):
+        raise ValueError("Invalid cursor")
+    index, key, record_id = parts
+    return index, (key, record_id)
+
+
+def _check_request(data):
+    limit = data.get("limit")
+    if limit is not None and (not isinstance(limit, int) or limit < 1):
+        raise ValueError("limit must be a positive integer")
+    for name in ("name_prefix", "created_from", "created_until"):
+        if data.get(name) is not None and not isinstance(data[name], str):
+            raise ValueError(f"{name} must be a string")
+    fields = data.get("fields")
+    if fields is not None and (not isinstance(fields, list) or not all(isinstance(f, str) for f in fields)):
+        raise ValueError("fields must be a list of field names")
+
+
+def list_page(collection, data, scope, name_index, time_index, default_fields):
+    """
+    Run a list request against collection and return the JSON response.
+
+    data may hold "name_prefix", "created_from" (inclusive), "created_until"
+    (exclusive), "fields" (defaults to default_fields), "limit" and the
+    "cursor" returned with the previous page. scope is the key prefix every
+    record of this listing shares on both indexes.
+
+    Without a limit the response is the plain list of records, as before.
+    With a limit it is {"items": [...], "next_cursor": <cursor or null>},
+    without indentation since pages are read by programs.
+    """
+    _check_request(data)
+    limit = data.get("limit")
+    fields = data.get("fields") or default_fields
+    prefix = data.get("name_prefix")
+    created_from = data.get("created_from")
+    created_until = data.get("created_until")
+    scope = ordered_key(*scope, "") if scope else ""
+
+    # walk the creation time index when the request filters on nothing else
+    if prefix is None and (created_from is not None or created_until is not None):
+        index = time_index
+        low = scope + (created_from or "")
+        high = scope + created_until if created_until is not None else scope + _HIGHEST
+    else:
+        index = name_index
+        low = scope + (prefix or "")
+        high = low + _HIGHEST
+
+    after = None
+    if data.get("cursor"):
+        cursor_index, after = _decode_cursor(data["cursor"])
+        if cursor_index != index:
+            raise ValueError("Cursor does not belong to this request")
+
+    items = []
+    next_cursor = None
+    last = None
+    for key, record in collection.scan(index, low, high, after):
+        if index == name_index:
+            created = record.get("creation_time", "")
+            if created_from is not None and created < created_from:
+                continue
+            if created_until is not None and created >= created_until:
+                continue
+        if limit is not None and len(items) == limit:
+            next_cursor = _encode_cursor(index, *last)
+            break
+        items.append({field: record[field] for field in fields if field in record})
+        last = (key, record["id"])
+
+    if limit is None:
+        return json.dumps(items, indent=2)
+    return json.dumps({"items": items, "next_cursor": next_cursor}, separators=(",", ":"))
@@ -1,29 +1,216 @@
 import json
-import os
 import uuid
+from contextlib import ExitStack
+from cache import cached, responses
 from datetime import datetime
+from export import check_format, pool_available, write_board, write_boards
+from paging import REQUEST_KEYS, list_page, ordered_key
 from project_board_base import ProjectBoardBase
+from records import Board, Task, TaskRef, TaskTerms
+from search import rank, task_entry, tokenize
+from manager import StoredManager
 
-class ProjectBoard(ProjectBoardBase):
+TASK_STATUSES = ("OPEN", "IN_PROGRESS", "COMPLETE")
 
-    def __init__(self, db_path="db/boards.json"):
-        self.boards_file = db_path
-        os.makedirs(os.path.dirname(self.boards_file), exist_ok=True)
+# version of each derived collection a db is rebuilt to once, kept in db/meta.json.
+# Bump one to have every db rebuild it on its next start.
+INDEX_VERSIONS = {"task_index": 1, "task_counts": 1, "search_index": 1}
 
-        try:
-            with open(self.boards_file, "r") as f:
-                json.load(f)
-        except Exception as e:
-            with open(self.boards_file, "w") as f:
-                f.write("[]")
 
-    def _read_boards(self):
-        with open(self.boards_file, "r") as f:
-            return json.load(f)
+# task counters with their total and the share of COMPLETE tasks, for the summaries
+def _progress(counts):
+    total = sum(counts.values())
+    return {
+        "task_counts": counts,
+        "total_tasks": total,
+        "percent_complete": round(100 * counts.get("COMPLETE", 0) / total, 1) if total else 0.0
+    }
 
-    def _write_boards(self, boards):
-        with open(self.boards_file, "w") as f:
-            json.dump(boards, f, indent=2)
+
+class ProjectBoard(ProjectBoardBase, StoredManager):
+
+    # storage_options: see StoredManager
+    def __init__(self, db_path="db/boards.json", **storage_options):
+        super().__init__(db_path, **storage_options)
+        self.boards = self._open(self.db_path, record_type=Board)
+        self.boards.add_index("team", lambda b: b["team_id"])
+        # board names are unique per team, case-insensitively
+        self.boards.add_index("team_name", lambda b: (b["team_id"], b["name"].lower()), unique=True)
+        # ordered indexes behind the paginated list_boards, scoped to a team and a status
+        self.boards.add_index("team_status_name", lambda b: ordered_key(b["team_id"], b["status"], b["name"]), ordered=True)
+        self.boards.add_index(
+            "team_status_created", lambda b: ordered_key(b["team_id"], b["status"], b["creation_time"]), ordered=True
+        )
+
+        # what has been built for this db so far, see _built
+        self.meta = self._open(self._db_file("meta.json"))
+
+        # boards.json only holds the board catalog, each board's tasks are a
+        # separate shard (db/tasks/<board_id>.json) loaded the first time it is used,
+        # next to its task counters (db/task_counts/<board_id>.json)
+        self.tasks_file = self._db_file("tasks.json")
+        self.counts_file = self._db_file("task_counts.json")
+        self._migrate_inline_tasks()
+        if not self._built("task_counts"):
+            self._migrate_task_counts()
+
+        # task id -> board id and assignee, so a task is found without opening every board's tasks.
+        # Every task write adds to it, so it is always journaled: an append per write instead of
+        # rewriting an entry for every task in the db.
+        self.task_index = self._open(self._db_file("task_index.json"), record_type=TaskRef, journal=True)
+        self.task_index.add_index("user", lambda t: t.get("user_id"))
+        if not self._built("task_index"):
+            self._rebuild_task_index()
+
+        # task id -> board, team and term counts, its "terms" index is the inverted index of search_tasks.
+        # Journaled like the task index, every task write adds to it too.
+        self.search_index = self._open(self._db_file("search_index.json"), record_type=TaskTerms, journal=True)
+        self.search_index.add_index("terms", lambda t: list(t["terms"]), multi=True)
+        if not self._built("search_index"):
+            self._rebuild_search_index()
+
+    def _get_board(self, board_id):
+        board = self.boards.get(board_id)
+        if board is None:
+            raise ValueError("Board not found")
+        return board
+
+    # the tasks of one board
+    def _tasks(self, board_id):
+        tasks = self._open(self.tasks_file, shard=board_id, record_type=Task)
+        # task titles are unique per board, case-insensitively
+        tasks.add_index("title", lambda t: t["title"].lower(), unique=True)
+        return tasks
+
+    # the tasks of one board for a read outside any transaction, caught up with other processes' writes
+    def _current_tasks(self, board_id):
+        tasks = self._tasks(board_id)
+        tasks.revalidate()
+        return tasks
+
+    # boards.json used to keep every task inline, move those into their board's shard once
+    def _migrate_inline_tasks(self):
+        if not any("tasks" in b for b in self.boards.values()):
+            return
+        with self.boards.transaction():
+            for b in list(self.boards.values()):
+                if "tasks" not in b:
+                    continue
+                tasks = self._tasks(b["id"])
+                with tasks.transaction():
+                    for t in b["tasks"]:
+                        if t["id"] not in tasks:
+                            tasks.insert(t)
+                self.boards.unset(b["id"], ["tasks"])
+
+    # the task counters of one board. A board without any has no tasks yet
+    def _counts(self, board_id):
+        return self._open(self.counts_file, shard=board_id)
+
+    # a board's task counters for a read outside any transaction, {status: n}
+    def _task_counts(self, board_id):
+        counts = self._counts(board_id)
+        counts.revalidate()
+        entry = counts.get(board_id)
+        return dict.fromkeys(TASK_STATUSES, 0) if entry is None else dict(entry["task_counts"])
+
+    # boards.json used to keep the task counters in the catalog (or none at all), move them
+    # next to each board's tasks once, counting the tasks of boards without counters
+    def _migrate_task_counts(self):
+        with self.boards.transaction():
+            # another process may have moved them while we waited for the lock
+            self.meta.revalidate()
+            if self._built("task_counts"):
+                return
+            for b in list(self.boards.values()):
+                counts = b.get("task_counts")
+                if counts is None:
+                    counts = dict.fromkeys(TASK_STATUSES, 0)
+                    for t in self._tasks(b["id"]).iter_values():
+                        counts[t["status"]] = counts.get(t["status"], 0) + 1
+                else:
+                    self.boards.unset(b["id"], ["task_counts"])
+                if any(counts.values()):
+                    shard = self._counts(b["id"])
+                    with shard.transaction():
+                        # boards already moved by an interrupted run keep theirs
+                        if b["id"] not in shard:
+                            shard.insert({"id": b["id"], "task_counts": counts})
+            self._mark_built("task_counts")
+
+    # enter the transactions of a board's counters and tasks on stack, in that order. The
+    # counter changes collected in changes[board_id] are made once the tasks are on disk.
+    def _enter_board(self, stack, board_id, changes):
+        stack.enter_context(self._counts(board_id).transaction())
+
+        def count_changes(exc_type, exc, tb):
+            if exc_type is None and changes.get(board_id):
+                self._update_counts(board_id, changes[board_id])
+
+        stack.push(count_changes)
+        tasks = self._tasks(board_id)
+        stack.enter_context(tasks.transaction())
+        return tasks
+
+    # add changes ({status: +n / -n}) to a board's task counters, inside the transaction of the
+    # counters and after the one of its tasks committed: a failed task write never counts
+    def _update_counts(self, board_id, changes):
+        shard = self._counts(board_id)
+        with shard.transaction():
+            entry = shard.get(board_id)
+            counts = dict.fromkeys(TASK_STATUSES, 0) if entry is None else dict(entry["task_counts"])
+            for status, change in changes.items():
+                counts[status] = counts.get(status, 0) + change
+            if entry is None:
+                shard.insert({"id": board_id, "task_counts": counts})
+            else:
+                shard.update(board_id, {"task_counts": counts})
+
+    # drop the cached responses built from these boards: their summaries, and their team's lists and rollup
+    def _invalidate_boards(self, board_ids):
+        scopes = set(board_ids)
+        for board_id in board_ids:
+            b = self.boards.get(board_id)
+            if b is not None:
+                scopes.add(b["team_id"])
+        responses.invalidate(self.boards, *scopes)
+
+    # whether the db has been brought up to INDEX_VERSIONS[name], e.g. had its task index rebuilt
+    def _built(self, name):
+        entry = self.meta.get(name)
+        return entry is not None and entry["version"] >= INDEX_VERSIONS[name]
+
+    # record that name is up to date, inside the transaction that brought it there
+    def _mark_built(self, name):
+        with self.meta.transaction():
+            if name in self.meta:
+                self.meta.update(name, {"version": INDEX_VERSIONS[name]})
+            else:
+                self.meta.insert({"id": name, "version": INDEX_VERSIONS[name]})
+
+    # index every task of every board, once per db: for databases written before the
+    # index (or its assignees) existed. Entries already there are kept.
+    def _rebuild_task_index(self):
+        # catalog lock first, like add_task(s), so it can't deadlock with them
+        with self.boards.transaction(), self.task_index.transaction():
+            for b in self.boards.values():
+                for t in self._tasks(b["id"]).values():
+                    entry = self.task_index.get(t["id"])
+                    if entry is None:
+                        self.task_index.insert({"id": t["id"], "board_id": b["id"], "user_id": t.get("user_id")})
+                    elif "user_id" not in entry:
+                        self.task_index.update(t["id"], {"user_id": t.get("user_id")})
+            self._mark_built("task_index")
+
+    # index the words of every task, once per db: for databases written before search
+    # existed. Entries already there are kept.
+    def _rebuild_search_index(self):
+        with self.boards.transaction(), self.search_index.transaction():
+            for b in self.boards.values():
+                for t in self._tasks(b["id"]).values():
+                    if t["id"] not in self.search_index:
+                        self.search_index.insert(task_entry(t, b))
+            self._mark_built("search_index")
 
     # create a board
     def create_board(self, request: str):
@@ -37,25 +224,21 @@ class ProjectBoard(ProjectBoardBase):
         if len(description) > 128:
             raise ValueError("Board description exceeds 128 characters")
 
-        boards = self._read_boards()
-
-       
-        for b in boards:
-            if b["team_id"] == team_id and b["name"].lower() == name.lower():
+        with self.boards.transaction():
+            if self.boards.find("team_name", (team_id, name.lower())) is not None:
                 raise ValueError("Board name must be unique within a team")
 
-        board_id = str(uuid.uuid4())
-        new_board = {
-            "id": board_id,
-            "name": name,
-            "description": description,
-            "team_id": team_id,
-            "creation_time": data.get("creation_time", datetime.now().isoformat()),
-            "status": "OPEN",
-            "tasks": []
-        }
-        boards.append(new_board)
-        self._write_boards(boards)
+            board_id = str(uuid.uuid4())
+            new_board = {
+                "id": board_id,
+                "name": name,
+                "description": description,
+                "team_id": team_id,
+                "creation_time": data.get("creation_time", datetime.now().isoformat()),
+                "status": "OPEN"
+            }
+            self.boards.insert(new_board)
+        responses.invalidate(self.boards, team_id)
         return json.dumps({"id": board_id})
 
     # close a board
@@ -63,20 +246,29 @@ class ProjectBoard(ProjectBoardBase):
         data = json.loads(request)
         board_id = data["id"]
 
-        boards = self._read_boards()
-        for b in boards:
-            if b["id"] == board_id:
-                if any(task["status"] != "COMPLETE" for task in b["tasks"]):
-                    raise ValueError("Cannot close board: All tasks must be COMPLETE")
-                b["status"] = "CLOSED"
-                b["end_time"] = datetime.now().isoformat()
-                self._write_boards(boards)
-                return json.dumps({"status": "Board closed"})
-        raise ValueError("Board not found")
+        # adding a task holds the catalog lock and every task write the lock of the board's
+        # counters, so with both no task can change under us
+        with self.boards.transaction():
+            self._get_board(board_id)
+            tasks = self._tasks(board_id)
+            with self._counts(board_id).transaction(), tasks.transaction():
+                # counted from the tasks themselves, the counters only serve the summaries. Counters
+                # a crash left behind between a task write and theirs are put right on the way.
+                counts = dict.fromkeys(TASK_STATUSES, 0)
+                for t in tasks.iter_values():
+                    counts[t["status"]] = counts.get(t["status"], 0) + 1
+                stored = self._task_counts(board_id)
+                if counts != stored:
+                    self._update_counts(board_id, {s: counts.get(s, 0) - stored.get(s, 0) for s in {*counts, *stored}})
+            if any(n for status, n in counts.items() if status != "COMPLETE"):
+                raise ValueError("Cannot close board: All tasks must be COMPLETE")
+            self.boards.update(board_id, {"status": "CLOSED", "end_time": datetime.now().isoformat()})
+        self._invalidate_boards([board_id])
+        return json.dumps({"status": "Board closed"})
 
-    # add task to board
-    def add_task(self, request: str) -> str:
-        data = json.loads(request)
+    # validate an add_task request and build the task, without storing it.
+    # Must run inside the board catalog's and the board tasks' transactions.
+    def _new_task(self, data):
         title = data["title"].strip()
         description = data["description"].strip()
         user_id = data["user_id"]
@@ -87,80 +279,311 @@ class ProjectBoard(ProjectBoardBase):
         if len(description) > 128:
             raise ValueError("Task description exceeds 128 characters")
 
-        boards = self._read_boards()
-        for b in boards:
-            if b["id"] == board_id:
-                if b["status"] != "OPEN":
-                    raise ValueError("Can only add tasks to an OPEN board")
-                # Unique title in the same board
-                for t in b["tasks"]:
-                    if t["title"].lower() == title.lower():
-                        raise ValueError("Task title must be unique in a board")
-                task_id = str(uuid.uuid4())
-                b["tasks"].append({
-                    "id": task_id,
-                    "title": title,
-                    "description": description,
-                    "user_id": user_id,
-                    "creation_time": data.get("creation_time", datetime.now().isoformat()),
-                    "status": "OPEN"
-                })
-                self._write_boards(boards)
-                return json.dumps({"id": task_id})
-        raise ValueError("Board not found")
+        b = self._get_board(board_id)
+        if b["status"] != "OPEN":
+            raise ValueError("Can only add tasks to an OPEN board")
+        # Unique title in the same board
+        if self._tasks(board_id).find("title", title.lower()) is not None:
+            raise ValueError("Task title must be unique in a board")
+
+        return {
+            "id": str(uuid.uuid4()),
+            "title": title,
+            "description": description,
+            "user_id": user_id,
+            "creation_time": data.get("creation_time", datetime.now().isoformat()),
+            "status": "OPEN"
+        }
+
+    # add task to board
+    def add_task(self, request: str) -> str:
+        data = json.loads(request)
+
+        # the catalog lock keeps the board from being closed while the task goes in
+        with self.boards.transaction(), ExitStack() as stack:
+            b = self._get_board(data["board_id"])
+            tasks = self._enter_board(stack, b["id"], {b["id"]: {"OPEN": 1}})
+            with self.task_index.transaction(), self.search_index.transaction():
+                task = self._new_task(data)
+                # index first: a crash in between leaves an entry for a missing task, never an unindexed task
+                self.task_index.insert({"id": task["id"], "board_id": data["board_id"], "user_id": task["user_id"]})
+                self.search_index.insert(task_entry(task, b))
+                tasks.insert(task)
+        return json.dumps({"id": task["id"]})
+
+    # add many tasks, validated one by one and committed with a single write per board
+    def add_tasks(self, request: str) -> str:
+        requests = json.loads(request)
+
+        if not isinstance(requests, list):
+            raise ValueError("Request must be a list of tasks")
+
+        results = []
+        changes = {}
+        with self.boards.transaction(), ExitStack() as stack:
+            stack.enter_context(self.task_index.transaction())
+            stack.enter_context(self.search_index.transaction())
+            in_transaction = set()
+            for data in requests:
+                try:
+                    board_id = data["board_id"]
+                    if board_id in self.boards and board_id not in in_transaction:
+                        self._enter_board(stack, board_id, changes)
+                        in_transaction.add(board_id)
+                    task = self._new_task(data)
+                except KeyError as e:
+                    results.append({"error": f"Missing required field: {e}"})
+                    continue
+                except ValueError as e:
+                    results.append({"error": str(e)})
+                    continue
+                except (TypeError, AttributeError) as e:
+                    # not an object, or a field of the wrong type
+                    results.append({"error": f"Invalid task: {e}"})
+                    continue
+
+                # inserted right away, so later titles in the batch are checked against it
+                self.task_index.insert({"id": task["id"], "board_id": board_id, "user_id": task["user_id"]})
+                self.search_index.insert(task_entry(task, self.boards.get(board_id)))
+                self._tasks(board_id).insert(task)
+                board_changes = changes.setdefault(board_id, {})
+                board_changes["OPEN"] = board_changes.get("OPEN", 0) + 1
+                results.append({"id": task["id"]})
+
+        return json.dumps(results)
+
+    def _check_status(self, status):
+        if status not in TASK_STATUSES:
+            raise ValueError(f"Invalid status {status}, must be one of {', '.join(TASK_STATUSES)}")
+
+    # board id of a task, or None
+    def _find_task_board(self, task_id):
+        entry = self.task_index.get(task_id)
+        if entry is None:
+            # may have been added by another process since we loaded the index
+            with self.task_index.transaction():
+                entry = self.task_index.get(task_id)
+        return None if entry is None else entry["board_id"]
 
     # update the status of a task
     def update_task_status(self, request: str):
         data = json.loads(request)
         task_id = data["id"]
         new_status = data["status"]
+        self._check_status(new_status)
+
+        board_id = self._find_task_board(task_id)
+        if board_id is None:
+            raise ValueError("Task not found")
+        # only the board's files are written: its tasks and their counters
+        changes = {}
+        with ExitStack() as stack:
+            tasks = self._enter_board(stack, board_id, changes)
+            task = tasks.get(task_id)
+            if task is None:
+                raise ValueError("Task not found")
+            old_status = task["status"]
+            tasks.update(task_id, {"status": new_status})
+            if old_status != new_status:
+                changes[board_id] = {old_status: -1, new_status: 1}
+        return json.dumps({"status": "Task updated"})
+
+    # update many task statuses, committed with a single write per board
+    def update_task_statuses(self, request: str) -> str:
+        requests = json.loads(request)
+
+        if not isinstance(requests, list):
+            raise ValueError("Request must be a list of status updates")
+
+        results = []
+        changes = {}
+        # nothing is written to the catalog, its lock only orders batches taking several boards' locks
+        with self.boards.transaction(), ExitStack() as stack:
+            in_transaction = set()
+            for data in requests:
+                try:
+                    task_id = data["id"]
+                    new_status = data["status"]
+                    self._check_status(new_status)
+                    board_id = self._find_task_board(task_id)
+                except KeyError as e:
+                    results.append({"error": f"Missing required field: {e}"})
+                    continue
+                except ValueError as e:
+                    results.append({"error": str(e)})
+                    continue
+                except (TypeError, AttributeError) as e:
+                    # not an object, or a field of the wrong type
+                    results.append({"error": f"Invalid status update: {e}"})
+                    continue
 
-        boards = self._read_boards()
-        for b in boards:
-            for t in b["tasks"]:
-                if t["id"] == task_id:
-                    t["status"] = new_status
-                    self._write_boards(boards)
-                    return json.dumps({"status": "Task updated"})
-        raise ValueError("Task not found")
+                if board_id is None:
+                    results.append({"error": "Task not found"})
+                    continue
 
-    # list all open boards for a team
+                tasks = self._tasks(board_id)
+                if board_id not in in_transaction:
+                    self._enter_board(stack, board_id, changes)
+                    in_transaction.add(board_id)
+                task = tasks.get(task_id)
+                if task is None:
+                    results.append({"error": "Task not found"})
+                    continue
+                old_status = task["status"]
+                tasks.update(task_id, {"status": new_status})
+                board_changes = changes.setdefault(board_id, {})
+                board_changes[old_status] = board_changes.get(old_status, 0) - 1
+                board_changes[new_status] = board_changes.get(new_status, 0) + 1
+                results.append({"id": task_id})
+
+        return json.dumps(results)
+
+    # list the open boards of a team, or a filtered page of its open or closed boards
+    @cached("boards", lambda self, data: [(self.boards, data["id"])])
     def list_boards(self, request: str) -> str:
         data = json.loads(request)
         team_id = data["id"]
 
-        boards = self._read_boards()
+        # filters and pagination, see paging.list_page
+        if "status" in data or any(key in data for key in REQUEST_KEYS):
+            status = data.get("status", "OPEN")
+            if status not in ("OPEN", "CLOSED"):
+                raise ValueError("Invalid status, must be OPEN or CLOSED")
+            return list_page(
+                self.boards, data, (team_id, status), "team_status_name", "team_status_created", ["id", "name"]
+            )
+
         open_boards = [
             {"id": b["id"], "name": b["name"]}
-            for b in boards
-            if b["team_id"] == team_id and b["status"] == "OPEN"
+            for b in self.boards.find_all("team", team_id)
+            if b["status"] == "OPEN"
         ]
         return json.dumps(open_boards, indent=2)
 
+    # task counters and progress of one board, without reading its tasks
+    def board_summary(self, request: str) -> str:
+        data = json.loads(request)
+        self.boards.revalidate()
+        b = self._get_board(data["id"])
+        summary = {"id": b["id"], "name": b["name"], "status": b["status"]}
+        summary.update(_progress(self._task_counts(b["id"])))
+        return json.dumps(summary, indent=2)
+
+    # the task counters of every board of a team added up
+    def team_summary(self, request: str) -> str:
+        data = json.loads(request)
+        team_id = data["id"]
+
+        self.boards.revalidate()
+        boards = {"OPEN": 0, "CLOSED": 0}
+        counts = dict.fromkeys(TASK_STATUSES, 0)
+        for b in self.boards.find_all("team", team_id):
+            boards[b["status"]] = boards.get(b["status"], 0) + 1
+            for status, n in self._task_counts(b["id"]).items():
+                counts[status] = counts.get(status, 0) + n
+        summary = {"team_id": team_id, "boards": boards}
+        summary.update(_progress(counts))
+        return json.dumps(summary, indent=2)
+
+    # tasks whose title or description match the words of a query, best match first
+    def search_tasks(self, request: str) -> str:
+        data = json.loads(request)
+        query = data["query"]
+        if not isinstance(query, str) or not tokenize(query):
+            raise ValueError("Query must contain at least one word")
+        limit = data.get("limit", 20)
+        if not isinstance(limit, int) or limit < 1:
+            raise ValueError("limit must be a positive integer")
+
+        self.search_index.revalidate()
+        results = []
+        for score, entry in rank(self.search_index, query, data.get("team_id"), data.get("board_id"), limit):
+            t = self._current_tasks(entry["board_id"]).get(entry["id"])
+            if t is None:
+                continue
+            results.append({
+                "id": t["id"],
+                "title": t["title"],
+                "status": t["status"],
+                "board_id": entry["board_id"],
+                "score": round(score, 4)
+            })
+        return json.dumps(results, indent=2)
+
+    # the tasks assigned to a user on every board, found through the task index
+    def list_user_tasks(self, request: str) -> str:
+        data = json.loads(request)
+        user_id = data["id"]
+        status = data.get("status")
+        if status is not None:
+            self._check_status(status)
+        board_status = data.get("board_status")
+        if board_status is not None and board_status not in ("OPEN", "CLOSED"):
+            raise ValueError("Invalid board_status, must be OPEN or CLOSED")
+
+        self.task_index.revalidate()
+        self.boards.revalidate()
+        task_ids = {}
+        for entry in self.task_index.find_all("user", user_id):
+            task_ids.setdefault(entry["board_id"], []).append(entry["id"])
+
+        # only the boards holding the user's tasks are opened, each once
+        user_tasks = []
+        for board_id, ids in task_ids.items():
+            b = self.boards.get(board_id)
+            if b is None or (board_status is not None and b["status"] != board_status):
+                continue
+            tasks = self._current_tasks(board_id)
+            for task_id in ids:
+                t = tasks.get(task_id)
+                if t is None or (status is not None and t["status"] != status):
+                    continue
+                user_tasks.append({
+                    "id": t["id"],
+                    "title": t["title"],
+                    "description": t["description"],
+                    "status": t["status"],
+                    "creation_time": t["creation_time"],
+                    "board_id": board_id,
+                    "board_name": b["name"]
+                })
+        return json.dumps(user_tasks, indent=2)
+
     # export board
     def export_board(self, request: str) -> str:
         data = json.loads(request)
         board_id = data["id"]
+        fmt = data.get("format", "txt")
+        check_format(fmt)
 
-        boards = self._read_boards()
-        for b in boards:
-            if b["id"] == board_id:
-                if not os.path.exists("out"):
-                    os.makedirs("out")
-                filename = f"out/board_{board_id}.txt"
-                with open(filename, "w") as f:
-                    f.write(f"Board: {b['name']}\n")
-                    f.write(f"Description: {b['description']}\n")
-                    f.write(f"Team ID: {b['team_id']}\n")
-                    f.write(f"Status: {b['status']}\n")
-                    f.write(f"Created: {b['creation_time']}\n")
-                    if "end_time" in b:
-                        f.write(f"Closed: {b['end_time']}\n")
-                    f.write("\nTasks:\n")
-                    for t in b["tasks"]:
-                        f.write(f"  - {t['title']} [{t['status']}]\n")
-                        f.write(f"    Description: {t['description']}\n")
-                        f.write(f"    Assigned to: {t['user_id']}\n")
-                        f.write(f"    Created: {t['creation_time']}\n\n")
-                return json.dumps({"out_file": filename})
-        raise ValueError("Board not found")
+        self.boards.revalidate()
+        b = self._get_board(board_id)
+        filename = write_board(b, self._current_tasks(board_id).iter_values(), fmt)
+        return json.dumps({"out_file": filename})
+
+    # boards of an export_boards request: the listed ids, or every board of a team
+    def _export_targets(self, data):
+        if "ids" in data:
+            return [self._get_board(board_id) for board_id in data["ids"]]
+        if "team_id" in data:
+            return self.boards.find_all("team", data["team_id"])
+        raise ValueError("Request must have ids or team_id")
+
+    # export many boards in one pass over the catalog, optionally on a pool of worker processes
+    def export_boards(self, request: str) -> str:
+        data = json.loads(request)
+        fmt = data.get("format", "txt")
+        check_format(fmt)
+        workers = data.get("workers", 1)
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError("workers must be a positive integer")
+
+        self.boards.revalidate()
+        boards = self._export_targets(data)
+        if workers == 1 or not pool_available():
+            out_files = [write_board(b, self._current_tasks(b["id"]).iter_values(), fmt) for b in boards]
+        else:
+            # one snapshot of every board's tasks, shared by all workers
+            jobs = [(b, self._current_tasks(b["id"]).values()) for b in boards]
+            out_files = write_boards(jobs, fmt, workers)
+        return json.dumps({"out_files": out_files})
@@ -71,6 +71,49 @@ class ProjectBoardBase:
         """
         pass
 
+    # add many tasks in one call
+    def add_tasks(self, request: str) -> str:
+        """
+        :param request: A json list of add_task requests, tasks can target different boards
+        [
+          {
+            "title" : "<task_title>",
+            "description" : "<description>",
+            "user_id" : "<user id>",
+            "board_id" : "<board id>"
+          }
+        ]
+        :return: A json list with one result per request, in the same order
+        [
+          {"id" : "<task_id>"} | {"error" : "<reason the task was not added>"}
+        ]
+
+        Constraint:
+         * same constraints as add_task, checked per task (including against tasks earlier in the list)
+         * all tasks that pass are stored in a single write
+        """
+        pass
+
+    # update the status of many tasks in one call
+    def update_task_statuses(self, request: str) -> str:
+        """
+        :param request: A json list of update_task_status requests
+        [
+          {
+            "id" : "<task_id>",
+            "status" : "OPEN | IN_PROGRESS | COMPLETE"
+          }
+        ]
+        :return: A json list with one result per request, in the same order
+        [
+          {"id" : "<task_id>"} | {"error" : "<reason the task was not updated>"}
+        ]
+
+        Constraint:
+         * all updates that pass are stored in a single write
+        """
+        pass
+
     # list all open boards for a team
     def list_boards(self, request: str) -> str:
         """
@@ -86,6 +129,107 @@ class ProjectBoardBase:
             "name" : "<board_name>"
           }
         ]
+
+        The request may also filter, sort and paginate like list_users, and pick "status":
+        {
+          "id" : "<team_id>",
+          "status" : "OPEN" | "CLOSED",
+          "name_prefix" : "<start of the name>",
+          "created_from" : "<date:time>",
+          "created_until" : "<date:time>",
+          "fields" : ["<field>", ...],
+          "limit" : <page size>,
+          "cursor" : "<next_cursor of the previous page>"
+        }
+        """
+        pass
+
+    # task counts and progress of a board
+    def board_summary(self, request: str) -> str:
+        """
+        :param request: A json string with the board identifier
+        {
+          "id" : "<board_id>"
+        }
+
+        :return:
+        {
+          "id" : "<board_id>",
+          "name" : "<board_name>",
+          "status" : "OPEN | CLOSED",
+          "task_counts" : {"OPEN" : <n>, "IN_PROGRESS" : <n>, "COMPLETE" : <n>},
+          "total_tasks" : <n>,
+          "percent_complete" : <share of COMPLETE tasks, 0 to 100>
+        }
+        """
+        pass
+
+    # task counts and progress of all boards of a team
+    def team_summary(self, request: str) -> str:
+        """
+        :param request: A json string with the team identifier
+        {
+          "id" : "<team_id>"
+        }
+
+        :return:
+        {
+          "team_id" : "<team_id>",
+          "boards" : {"OPEN" : <n>, "CLOSED" : <n>},
+          "task_counts" : {"OPEN" : <n>, "IN_PROGRESS" : <n>, "COMPLETE" : <n>},
+          "total_tasks" : <n>,
+          "percent_complete" : <share of COMPLETE tasks, 0 to 100>
+        }
+        """
+        pass
+
+    # find tasks by the words of their title and description
+    def search_tasks(self, request: str) -> str:
+        """
+        :param request: A json string with the words to look for. "team_id" or "board_id" restrict the search
+        to a team's or a board's tasks, "limit" is the number of results (default 20)
+        {
+          "query" : "<words>",
+          "team_id" : "<team_id>",
+          "board_id" : "<board_id>",
+          "limit" : <n>
+        }
+
+        :return: the tasks holding every word of the query, best match first
+        [
+          {
+            "id" : "<task_id>",
+            "title" : "<task_title>",
+            "status" : "<task status>",
+            "board_id" : "<board_id>",
+            "score" : <relevance>
+          }
+        ]
+        """
+        pass
+
+    # list the tasks assigned to a user, across all boards
+    def list_user_tasks(self, request: str) -> str:
+        """
+        :param request: A json string with the user identifier, "status" and "board_status" are optional filters
+        {
+          "id" : "<user_id>",
+          "status" : "OPEN | IN_PROGRESS | COMPLETE",
+          "board_status" : "OPEN | CLOSED"
+        }
+
+        :return: the user's tasks, grouped by board
+        [
+          {
+            "id" : "<task_id>",
+            "title" : "<task_title>",
+            "description" : "<description>",
+            "status" : "<task status>",
+            "creation_time" : "<date:time when task was created>",
+            "board_id" : "<board_id>",
+            "board_name" : "<board_name>"
+          }
+        ]
         """
         pass
 
@@ -93,9 +237,12 @@ class ProjectBoardBase:
         """
         Export a board in the out folder. The output will be a txt file.
         We want you to be creative. Output a presentable view of the board and its tasks with the available data.
+        "format" is optional: "txt" (default), "csv" (one row per task) or "jsonl" (the board on the
+        first line, then one task per line).
         :param request:
         {
-          "id" : "<board_id>"
+          "id" : "<board_id>",
+          "format" : "txt" | "csv" | "jsonl"
         }
         :return:
         {
@@ -103,3 +250,21 @@ class ProjectBoardBase:
         }
         """
         pass
+
+    def export_boards(self, request: str) -> str:
+        """
+        Export several boards like export_board, either the listed ones or every board of a team.
+        "workers" is optional: with more than 1 the boards are rendered on that many processes,
+        in a process that runs a single thread (not under the server, see export.pool_available).
+        :param request:
+        {
+          "ids" : ["<board_id>", ...],  or  "team_id" : "<team_id>",
+          "format" : "txt" | "csv" | "jsonl",
+          "workers" : <number of processes>
+        }
+        :return:
+        {
+          "out_files" : ["<name of a file created>", ...]
+        }
+        """
+        pass
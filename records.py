@@ -0,0 +1,173 @@
+"""
+Compact in-memory records for the JSON backend.
+
+A db file parsed with json gives one dict per record, each with its own hash
+table of repeated keys. The classes here keep the known fields of a user,
+team, board or task in __slots__ instead, which takes a fraction of the
+memory, and intern the strings that repeat across many records (statuses,
+team and user ids). They behave like the dicts they replace (record["name"],
+record.get(...), "end_time" in record, update, pop, ...), so the managers
+don't care which one they get. Fields a class doesn't know, e.g. from an
+older db, go to a small per-record dict.
+"""
+import sys
+from collections.abc import MutableMapping
+
+_MISSING = object()
+
+
+class Record(MutableMapping):
+    __slots__ = ("_extra",)
+
+    # known fields, in the order they are written out
+    FIELDS = ()
+    # fields whose values repeat across records and are interned
+    INTERNED = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fieldset = frozenset(cls.FIELDS)
+        cls._interned = frozenset(cls.INTERNED)
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls.__new__(cls)
+        record._extra = None
+        fields = cls._fieldset
+        interned = cls._interned
+        for key, value in data.items():
+            if key not in fields:
+                record[key] = value
+            elif key in interned and type(value) is str:
+                setattr(record, key, sys.intern(value))
+            else:
+                setattr(record, key, value)
+        return record
+
+    # reads the slots directly, much faster than the MutableMapping mixins
+    def to_dict(self):
+        data = {}
+        for field in self.FIELDS:
+            value = getattr(self, field, _MISSING)
+            if value is not _MISSING:
+                data[field] = value
+        if self._extra is not None:
+            data.update(self._extra)
+        return data
+
+    # a record of the same class with the same fields, changing one leaves the other alone
+    def copy(self):
+        record = type(self).__new__(type(self))
+        for field in self.FIELDS:
+            value = getattr(self, field, _MISSING)
+            if value is not _MISSING:
+                setattr(record, field, value)
+        record._extra = None if self._extra is None else dict(self._extra)
+        return record
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def values(self):
+        return self.to_dict().values()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __getitem__(self, key):
+        if key in self._fieldset:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._fieldset:
+            if key in self._interned and type(value) is str:
+                value = sys.intern(value)
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._fieldset:
+            if getattr(self, key, _MISSING) is _MISSING:
+                raise KeyError(key)
+            delattr(self, key)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self._fieldset:
+            return getattr(self, key, _MISSING) is not _MISSING
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if getattr(self, field, _MISSING) is not _MISSING:
+                yield field
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __reduce__(self):
+        return type(self).from_dict, (self.to_dict(),)
+
+
+class User(Record):
+    __slots__ = ("id", "name", "display_name", "description", "creation_time")
+    FIELDS = __slots__
+
+
+class Team(Record):
+    __slots__ = ("id", "name", "description", "admin", "creation_time", "users")
+    FIELDS = __slots__
+    INTERNED = ("admin",)
+
+
+class Board(Record):
+    __slots__ = ("id", "name", "description", "team_id", "creation_time", "status", "end_time")
+    FIELDS = __slots__
+    INTERNED = ("team_id", "status")
+
+
+class Task(Record):
+    __slots__ = ("id", "title", "description", "user_id", "creation_time", "status")
+    FIELDS = __slots__
+    INTERNED = ("user_id", "status")
+
+
+class TaskRef(Record):
+    """
+    Entry of the task index: the board and assignee of a task.
+    """
+    __slots__ = ("id", "board_id", "user_id")
+    FIELDS = __slots__
+    INTERNED = ("board_id", "user_id")
+
+
+class TaskTerms(Record):
+    """
+    Entry of the search index: the board, team and term counts of a task.
+    """
+    __slots__ = ("id", "board_id", "team_id", "terms", "length")
+    FIELDS = __slots__
+    INTERNED = ("board_id", "team_id")
+
+
+# json.dumps(..., default=plain) serializes records like the dicts they stand for
+def plain(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,63 @@
+"""
+Full-text search over task titles and descriptions, used by ProjectBoard.search_tasks.
+
+Every task has one entry in the search index collection: its board, its
+team and how often each term occurs in its title and description. A multi
+index on the terms is the inverted index (term -> tasks). A task matches
+when it holds every word of the query, so a query only reads the entries
+of its rarest word. Matches are ranked by TF-IDF: a term counts more the
+more often it occurs in a task, relative to the task's length, and the
+fewer tasks contain it.
+"""
+import heapq
+import math
+import re
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+# search index entry of a task of board
+def task_entry(task, board):
+    terms = {}
+    for term in tokenize(f"{task['title']} {task['description']}"):
+        terms[term] = terms.get(term, 0) + 1
+    return {
+        "id": task["id"],
+        "board_id": board["id"],
+        "team_id": board["team_id"],
+        "terms": terms,
+        "length": sum(terms.values())
+    }
+
+
+def rank(index, query, team_id=None, board_id=None, limit=20):
+    """
+    The best `limit` (score, entry) pairs of index for the tasks holding
+    every word of query, best first, restricted to a team and/or a board
+    if given. Only the entries of the query's rarest term are read, the
+    other terms are counted on the index and checked on those entries.
+    """
+    terms = set(tokenize(query))
+    counts = {term: index.count("terms", term) for term in terms}
+    if not terms or not all(counts.values()):
+        return []
+    total = len(index)
+    idf = {term: math.log(1 + total / n) for term, n in counts.items()}
+
+    scores = {}
+    entries = {}
+    for entry in index.find_all("terms", min(terms, key=counts.get)):
+        if team_id is not None and entry["team_id"] != team_id:
+            continue
+        if board_id is not None and entry["board_id"] != board_id:
+            continue
+        found = entry["terms"]
+        if all(term in found for term in terms):
+            scores[entry["id"]] = sum(found[term] / entry["length"] * idf[term] for term in terms)
+            entries[entry["id"]] = entry
+    best = heapq.nsmallest(limit, scores, key=lambda task_id: (-scores[task_id], task_id))
+    return [(scores[task_id], entries[task_id]) for task_id in best]
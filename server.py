@@ -0,0 +1,151 @@
+"""
+Serve every API method over local HTTP from one long-running process.
+
+    python server.py --port 8765 --journal
+    python server.py --unix-socket /tmp/planner.sock --backend sqlite
+
+    curl -d '{"name": "alice", "display_name": "Alice"}' localhost:8765/create_user
+    curl localhost:8765/list_users
+
+POST /<method> calls the method with the request body as its JSON request
+and answers with its JSON response; GET /<method> (or an empty body) calls
+it without a request, for list_users and list_teams. GET / lists the methods.
+A request the managers refuse, or one that isn't the JSON object (array for
+the batch methods) the method takes, is answered 400 with {"error": ...},
+an unknown method 404.
+
+The db is loaded once and stays in memory, so reads are answered from the
+managers' indexes and the response cache; a thread per connection serves
+clients concurrently, and writes are serialized by the Dispatcher.
+Connections are kept alive, so a client pays the connect once.
+"""
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dispatch import API_ERRORS, METHODS, Dispatcher, error_message
+
+
+class PlannerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in two writes, don't let the second wait for an ack
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path == "/":
+            self._send(200, json.dumps({"methods": sorted(METHODS)}))
+        else:
+            self._call(None)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else None
+        self._call(body)
+
+    def _call(self, request):
+        method = self.path.strip("/")
+        if method not in METHODS:
+            self._send(404, json.dumps({"error": f"Unknown method {method}"}))
+            return
+        try:
+            response = self.server.dispatcher.call(method, request)
+        except API_ERRORS as e:
+            self._send(400, json.dumps({"error": error_message(e)}))
+        except Exception as e:
+            # a bug: logged, and answered without dropping the connection
+            sys.stderr.write(f"{method} failed:\n{traceback.format_exc()}")
+            self._send(500, json.dumps({"error": f"{type(e).__name__}: {e}"}))
+        else:
+            self._send(200, response)
+
+    def _send(self, status, body):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class UnixPlannerHandler(PlannerHandler):
+    disable_nagle_algorithm = False
+
+    # unix socket peers have no address
+    def address_string(self):
+        return "unix"
+
+
+class PlannerServer(ThreadingHTTPServer):
+
+    def __init__(self, address, dispatcher, verbose=False):
+        self.dispatcher = dispatcher
+        self.verbose = verbose
+        super().__init__(address, PlannerHandler)
+
+
+class UnixPlannerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, dispatcher, verbose=False):
+        self.dispatcher = dispatcher
+        self.verbose = verbose
+        # a socket file left behind by an earlier run would fail the bind
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, UnixPlannerHandler)
+
+
+# stop on SIGTERM like on Ctrl-C, so group commit writes are flushed before exiting
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the planner APIs over local HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", help="listen on this unix socket instead of TCP")
+    parser.add_argument("--db-dir", default="db")
+    parser.add_argument("--backend", choices=["json", "sqlite", "mmap"], default="json")
+    parser.add_argument("--journal", action="store_true")
+    parser.add_argument("--encoding", choices=["json", "json-min", "binary"], default=None,
+                        help="on-disk encoding of the JSON backend")
+    parser.add_argument("--flush-interval", type=float, default=None, help="enable group commit")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    storage_options = {"journal": args.journal, "backend": args.backend, "encoding": args.encoding}
+    if args.flush_interval is not None:
+        storage_options["flush_interval"] = args.flush_interval
+    dispatcher = Dispatcher(args.db_dir, **storage_options)
+
+    if args.unix_socket:
+        server = UnixPlannerServer(args.unix_socket, dispatcher, args.verbose)
+        print(f"Serving on {args.unix_socket}")
+    else:
+        server = PlannerServer((args.host, args.port), dispatcher, args.verbose)
+        print(f"Serving on http://{args.host}:{server.server_address[1]}")
+
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        dispatcher.flush()
+        if args.unix_socket:
+            os.unlink(args.unix_socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import instrumentation
+from storage import Collection, apply_change
+
+
+class _Database:
+    """
+    The connections to a sqlite db file, shared by every collection stored in it.
+
+    The db runs in WAL mode so readers never wait for a writer. Writes go
+    through one connection. Transactions on it are explicit and re-entrant:
+    the outermost one issues BEGIN IMMEDIATE, which takes sqlite's write
+    lock across processes, and commits (or rolls back on error) when it
+    exits. Every other thread reads through a connection of its own, so it
+    only ever sees committed data, never the open transaction of the thread
+    writing; that thread reads through the write connection and sees its
+    own writes.
+    """
+
+    def __init__(self, db_file):
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None, cached_statements=256)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self._lock = threading.RLock()
+        self._depth = 0
+        # thread running the open transaction, if any
+        self._owner = None
+        self._local = threading.local()
+        # changes when another connection commits, see revalidate()
+        self._data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        self.generation = 0
+
+    # the connection the calling thread runs its statements on
+    def connection(self):
+        if self._owner == threading.get_ident():
+            return self.conn
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, isolation_level=None, cached_statements=256)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    # bump generation if another process committed since the last call
+    def revalidate(self):
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self.generation += 1
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self._owner = threading.get_ident()
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._owner = None
+                    self.conn.execute("ROLLBACK")
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._owner = None
+                    self.conn.execute("COMMIT")
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def _open_database(db_file):
+    key = os.path.abspath(db_file)
+    with _databases_lock:
+        database = _databases.get(key)
+        if database is None:
+            database = _Database(key)
+            _databases[key] = database
+        return database
+
+
+def _column_value(value):
+    # index keys may be tuples (e.g. team_id + board name), sqlite stores them as JSON text
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+class SqliteCollection(Collection):
+    """
+    Collection stored as a table in db/planner.sqlite3.
+
+    Each record is one row: its id is the primary key and the record itself is
+    kept as JSON in the data column. Every secondary index becomes an extra
+    ix_<name> column with a b-tree index on it, so lookups are O(log n) and
+    only the matching rows are read. All statements are parameterized and
+    served from the connection's statement cache.
+
+    A sharded collection shares its table with the other shards and only
+    sees the rows whose shard column matches; its indexes lead with that
+    column.
+
+    A multi index (several keys per record) is a side table
+    <table>__<index> of (value, id) pairs, rewritten for a record whenever
+    the record is written.
+    """
+
+    def __init__(self, path, shard=None):
+        self.table = os.path.splitext(os.path.basename(path))[0]
+        if not re.fullmatch(r"\w+", self.table):
+            raise ValueError(f"Invalid collection name {self.table}")
+        self.db_file = os.path.join(os.path.dirname(path), "planner.sqlite3")
+        self.shard = shard
+        # extra condition and parameters that restrict every query to this shard
+        self._scope = ("", ()) if shard is None else (" AND shard = ?", (shard,))
+        self._db = _open_database(self.db_file)
+        self._indexes = {}
+        self._multi_indexes = {}
+        with self._db.transaction():
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            if shard is not None and "shard" not in self._columns():
+                self._conn.execute(f'ALTER TABLE "{self.table}" ADD COLUMN shard TEXT')
+                self._conn.execute(f'CREATE INDEX IF NOT EXISTS "{self.table}_shard" ON "{self.table}" (shard)')
+
+    # the write connection inside this thread's transaction, else the thread's own read connection
+    @property
+    def _conn(self):
+        return self._db.connection()
+
+    def _columns(self):
+        return {row[1] for row in self._conn.execute(f'PRAGMA table_info("{self.table}")')}
+
+    def add_index(self, name, key, unique=False, multi=False, ordered=False):
+        if name in self._indexes or name in self._multi_indexes:
+            return
+        if not re.fullmatch(r"\w+", name):
+            raise ValueError(f"Invalid index name {name}")
+        if multi:
+            self._add_multi_index(name, key)
+            return
+        column = f"ix_{name}"
+
+        with self._db.transaction():
+            if column not in self._columns():
+                self._conn.execute(f'ALTER TABLE "{self.table}" ADD COLUMN {column} TEXT')
+                # backfill rows written before the index existed
+                rows = self._conn.execute(f'SELECT id, data FROM "{self.table}"').fetchall()
+                self._conn.executemany(
+                    f'UPDATE "{self.table}" SET {column} = ? WHERE id = ?',
+                    [(_column_value(key(json.loads(data))), record_id) for record_id, data in rows],
+                )
+            leading = "" if self.shard is None else "shard, "
+            # an ordered index also covers the id, so scan() never has to sort
+            trailing = ", id" if ordered else ""
+            self._conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "{self.table}_{column}" ON "{self.table}" ({leading}{column}{trailing})'
+            )
+        self._indexes[name] = key
+
+    def _add_multi_index(self, name, key):
+        side = f"{self.table}__{name}"
+        with self._db.transaction():
+            exists = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (side,)
+            ).fetchone()
+            if not exists:
+                self._conn.execute(f'CREATE TABLE "{side}" (value TEXT NOT NULL, id TEXT NOT NULL)')
+                self._conn.execute(f'CREATE INDEX "{side}_value" ON "{side}" (value)')
+                self._conn.execute(f'CREATE INDEX "{side}_id" ON "{side}" (id)')
+                # backfill rows written before the index existed
+                rows = self._conn.execute(f'SELECT id, data FROM "{self.table}"').fetchall()
+                self._conn.executemany(
+                    f'INSERT INTO "{side}" (value, id) VALUES (?, ?)',
+                    [
+                        (_column_value(value), record_id)
+                        for record_id, data in rows
+                        for value in set(key(json.loads(data)) or ())
+                    ],
+                )
+        self._multi_indexes[name] = key
+
+    # rewrite the multi index entries of one record
+    def _write_multi(self, record):
+        for name, key in self._multi_indexes.items():
+            side = f"{self.table}__{name}"
+            self._conn.execute(f'DELETE FROM "{side}" WHERE id = ?', (record["id"],))
+            self._conn.executemany(
+                f'INSERT INTO "{side}" (value, id) VALUES (?, ?)',
+                [(_column_value(value), record["id"]) for value in set(key(record) or ())],
+            )
+
+    # every query reads the db, so only the generation has to follow other processes' writes.
+    # sqlite reports changes per file, a write to any collection in it bumps all of them.
+    @property
+    def generation(self):
+        return self._db.generation
+
+    def revalidate(self):
+        self._db.revalidate()
+
+    def __len__(self):
+        where, params = self._scope
+        return self._conn.execute(f'SELECT COUNT(*) FROM "{self.table}" WHERE 1{where}', params).fetchone()[0]
+
+    # decode fetched rows, counted as the load phase when instrumentation is on
+    def _decode(self, rows, started):
+        rows = [data for (data,) in rows]
+        records = [json.loads(data) for data in rows]
+        if instrumentation.enabled:
+            instrumentation.record_io("load", started, sum(len(data) for data in rows))
+        return records
+
+    def get(self, record_id):
+        # ids are strings, anything else (e.g. from a malformed request) can't be bound
+        if not isinstance(record_id, str):
+            return None
+        started = time.perf_counter()
+        where, params = self._scope
+        rows = self._conn.execute(
+            f'SELECT data FROM "{self.table}" WHERE id = ?{where}', (record_id,) + params
+        ).fetchall()
+        records = self._decode(rows, started)
+        return records[0] if records else None
+
+    def find_all(self, index, value):
+        started = time.perf_counter()
+        if index in self._multi_indexes:
+            scope = "" if self.shard is None else " AND t.shard = ?"
+            rows = self._conn.execute(
+                f'SELECT t.data FROM "{self.table}" t JOIN "{self.table}__{index}" s ON s.id = t.id '
+                f'WHERE s.value = ?{scope} ORDER BY t.rowid',
+                (_column_value(value),) + self._scope[1],
+            )
+            return self._decode(rows, started)
+        if index not in self._indexes:
+            raise KeyError(index)
+        where, params = self._scope
+        rows = self._conn.execute(
+            f'SELECT data FROM "{self.table}" WHERE ix_{index} = ?{where} ORDER BY rowid',
+            (_column_value(value),) + params,
+        )
+        return self._decode(rows, started)
+
+    def count(self, index, value):
+        where, params = self._scope
+        if index in self._multi_indexes:
+            if self.shard is None:
+                query = f'SELECT COUNT(*) FROM "{self.table}__{index}" WHERE value = ?'
+            else:
+                query = (
+                    f'SELECT COUNT(*) FROM "{self.table}__{index}" s JOIN "{self.table}" t ON s.id = t.id '
+                    f'WHERE s.value = ? AND t.shard = ?'
+                )
+        elif index in self._indexes:
+            query = f'SELECT COUNT(*) FROM "{self.table}" WHERE ix_{index} = ?{where}'
+        else:
+            raise KeyError(index)
+        return self._conn.execute(query, (_column_value(value),) + params).fetchone()[0]
+
+    def values(self):
+        started = time.perf_counter()
+        where, params = self._scope
+        rows = self._conn.execute(f'SELECT data FROM "{self.table}" WHERE 1{where} ORDER BY rowid', params)
+        return self._decode(rows, started)
+
+    # stream the rows batch_size at a time instead of decoding the whole table
+    def iter_values(self, batch_size=1000):
+        where, params = self._scope
+        cursor = self._conn.execute(f'SELECT data FROM "{self.table}" WHERE 1{where} ORDER BY rowid', params)
+        while True:
+            started = time.perf_counter()
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from self._decode(rows, started)
+
+    def scan(self, index, low=None, high=None, after=None):
+        if index not in self._indexes:
+            raise KeyError(index)
+        column = f"ix_{index}"
+        where, params = self._scope
+        if low is not None:
+            where += f" AND {column} >= ?"
+            params += (low,)
+        if high is not None:
+            where += f" AND {column} < ?"
+            params += (high,)
+        if after is not None:
+            where += f" AND ({column}, id) > (?, ?)"
+            params += tuple(after)
+        cursor = self._conn.execute(
+            f'SELECT {column}, data FROM "{self.table}" WHERE {column} IS NOT NULL{where} ORDER BY {column}, id',
+            params,
+        )
+        while True:
+            started = time.perf_counter()
+            rows = cursor.fetchmany(100)
+            if not rows:
+                return
+            keys = [key for key, _ in rows]
+            for key, record in zip(keys, self._decode([(data,) for _, data in rows], started)):
+                yield key, record
+
+    def _row(self, record):
+        names = list(self._indexes)
+        columns = ["id", "data"] + [f"ix_{name}" for name in names]
+        values = [record["id"], json.dumps(record)]
+        values += [_column_value(self._indexes[name](record)) for name in names]
+        if self.shard is not None:
+            columns.append("shard")
+            values.append(self.shard)
+        return ", ".join(columns), values
+
+    def insert(self, record):
+        started = time.perf_counter()
+        columns, values = self._row(record)
+        placeholders = ", ".join("?" * len(values))
+        try:
+            with self._db.transaction():
+                self._conn.execute(f'INSERT INTO "{self.table}" ({columns}) VALUES ({placeholders})', values)
+                self._write_multi(record)
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Record {record['id']} already exists")
+        instrumentation.record_io("dump", started, len(values[1]))
+        return record
+
+    def _change(self, op):
+        with self._db.transaction():
+            record = self.get(op["id"])
+            if record is None:
+                raise KeyError(op["id"])
+            apply_change(record, op)
+            started = time.perf_counter()
+            columns, values = self._row(record)
+            assignments = ", ".join(f"{column} = ?" for column in columns.split(", ")[1:])
+            self._conn.execute(
+                f'UPDATE "{self.table}" SET {assignments} WHERE id = ?', values[1:] + [record["id"]]
+            )
+            self._write_multi(record)
+        instrumentation.record_io("dump", started, len(values[1]))
+        return record
+
+    def transaction(self):
+        return self._db.transaction()
+
+    def unset(self, record_id, fields):
+        return self._change({"op": "unset", "id": record_id, "fields": list(fields)})
+
+    def update(self, record_id, fields):
+        return self._change({"op": "update", "id": record_id, "fields": fields})
+
+    def extend(self, record_id, field, items):
+        return self._change({"op": "extend", "id": record_id, "field": field, "items": list(items)})
@@ -0,0 +1,966 @@
+import atexit
+import bisect
+import heapq
+import json
+import marshal
+import os
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import instrumentation
+from locking import FileLock, atomic_write
+from records import Record, plain
+
+
+class _Index:
+    """
+    Hash index over one derived key of the records in a collection.
+
+    A unique index maps key -> record id, a non unique index maps
+    key -> ordered set (dict) of record ids. Records whose key is None
+    are not indexed. For a multi index the key function returns several
+    keys (e.g. the members of a team) and the record is indexed under each.
+    """
+
+    def __init__(self, key, unique, multi=False):
+        self.key = key
+        self.unique = unique
+        self.multi = multi
+        self.entries = {}
+
+    def _values(self, record):
+        value = self.key(record)
+        if value is None:
+            return ()
+        return set(value) if self.multi else (value,)
+
+    def add(self, record, entries=None):
+        entries = self.entries if entries is None else entries
+        for value in self._values(record):
+            if self.unique:
+                entries[value] = record["id"]
+            else:
+                entries.setdefault(value, {})[record["id"]] = None
+
+    def remove(self, record):
+        for value in self._values(record):
+            if self.unique:
+                if self.entries.get(value) == record["id"]:
+                    del self.entries[value]
+            else:
+                ids = self.entries.get(value)
+                if ids is not None:
+                    ids.pop(record["id"], None)
+                    if not ids:
+                        del self.entries[value]
+
+    # index every record from scratch and swap the result in at once
+    def rebuild(self, records):
+        entries = {}
+        for record in records:
+            self.add(record, entries)
+        self.entries = entries
+
+    def ids(self, value):
+        if self.unique:
+            record_id = self.entries.get(value)
+            return [] if record_id is None else [record_id]
+        return list(self.entries.get(value, ()))
+
+    def count(self, value):
+        if self.unique:
+            return int(value in self.entries)
+        return len(self.entries.get(value, ()))
+
+
+class _SortedIndex:
+    """
+    Ordered index over one derived key, for range scans and pagination.
+
+    entries is a sorted list of (key, record id) pairs, so records sharing a
+    key are ordered by id and every position in the index is unique.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.entries = []
+
+    def add(self, record, entries=None):
+        value = self.key(record)
+        if value is not None:
+            bisect.insort(self.entries if entries is None else entries, (value, record["id"]))
+
+    def remove(self, record):
+        value = self.key(record)
+        if value is None:
+            return
+        entry = (value, record["id"])
+        i = bisect.bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+
+    def _values(self, record):
+        value = self.key(record)
+        return () if value is None else (value,)
+
+    def rebuild(self, records):
+        entries = [(self.key(record), record["id"]) for record in records]
+        self.entries = sorted(entry for entry in entries if entry[0] is not None)
+
+    def ids(self, value):
+        entries = self.entries
+        i = bisect.bisect_left(entries, (value,))
+        ids = []
+        while i < len(entries) and entries[i][0] == value:
+            ids.append(entries[i][1])
+            i += 1
+        return ids
+
+    def count(self, value):
+        return len(self.ids(value))
+
+    # (key, id) pairs with low <= key < high, strictly after the pair `after`
+    def scan(self, low=None, high=None, after=None):
+        entries = self.entries
+        i = 0 if low is None else bisect.bisect_left(entries, (low,))
+        if after is not None:
+            i = max(i, bisect.bisect_right(entries, tuple(after)))
+        while i < len(entries):
+            entry = entries[i]
+            if high is not None and entry[0] >= high:
+                return
+            yield entry
+            i += 1
+
+
+# on-disk encodings of a JSON collection's snapshot:
+#   json      indented JSON, the original format, easy to read and diff
+#   json-min  JSON without whitespace
+#   binary    BINARY_MAGIC, then blocks of up to BINARY_BLOCK records, each a little-endian
+#             u32 length and the marshal'd list of (keys, values) tuples of its records.
+#             Records with the same fields share one keys tuple, so field names are
+#             stored once per block instead of once per record.
+ENCODINGS = ("json", "json-min", "binary")
+BINARY_MAGIC = b"PLANNERDB1\n"
+BINARY_BLOCK = 4096
+_LENGTH = struct.Struct("<I")
+
+
+def encode_records(records, encoding):
+    # records.Record to dicts once up front, json and marshal then only see builtins
+    records = [record.to_dict() if isinstance(record, Record) else record for record in records]
+    if encoding == "json":
+        return json.dumps(records, indent=2).encode()
+    if encoding == "json-min":
+        return json.dumps(records, separators=(",", ":")).encode()
+    parts = [BINARY_MAGIC]
+    for start in range(0, len(records), BINARY_BLOCK):
+        shapes = {}
+        rows = []
+        for record in records[start:start + BINARY_BLOCK]:
+            keys = tuple(record)
+            rows.append((shapes.setdefault(keys, keys), tuple(record.values())))
+        blob = marshal.dumps(rows, 4)
+        parts.append(_LENGTH.pack(len(blob)))
+        parts.append(blob)
+    return b"".join(parts)
+
+
+def decode_records(data):
+    """
+    Parse a snapshot in any of the ENCODINGS and return (records, encoding).
+    Raises ValueError if it is not one.
+    """
+    if data.startswith(BINARY_MAGIC):
+        records = []
+        view = memoryview(data)
+        pos = len(BINARY_MAGIC)
+        try:
+            while pos < len(data):
+                (size,) = _LENGTH.unpack_from(data, pos)
+                pos += _LENGTH.size
+                records.extend(dict(zip(keys, values)) for keys, values in marshal.loads(view[pos:pos + size]))
+                pos += size
+        except (struct.error, EOFError, TypeError) as e:
+            raise ValueError(f"Corrupt binary snapshot: {e}")
+        return records, "binary"
+    records = json.loads(data)
+    # "[]" could be either, new files default to indented
+    return records, "json-min" if len(data) > 2 and b"\n" not in data else "json"
+
+
+def apply_change(record, op):
+    """
+    Apply an update, unset or extend operation to a record dict in place.
+    """
+    if op["op"] == "update":
+        record.update(op["fields"])
+    elif op["op"] == "unset":
+        for field in op["fields"]:
+            record.pop(field, None)
+    elif op["op"] == "extend":
+        # a new list, a copy of the record may share the old one
+        record[op["field"]] = record.get(op["field"], []) + op["items"]
+    elif op["op"] == "append":
+        # single item form written by older journals
+        record[op["field"]] = record.get(op["field"], []) + [op["item"]]
+    else:
+        raise ValueError(f"Unknown operation {op['op']}")
+
+
+class Collection:
+    """
+    Interface of a persisted collection of records, each a dict with an "id".
+
+    Managers only talk to this interface, so the storage backend can be chosen
+    when a manager is constructed without changing any of the APIs.
+    """
+
+    # bumped whenever the records change other than through this process's own
+    # writes, e.g. when another process's writes are picked up, so anything
+    # derived from them (see cache.py) can tell it is out of date
+    generation = 0
+
+    # pick up what other processes wrote since the last call; a stat or two
+    # when nothing changed. Writes do it on their own when their transaction starts.
+    def revalidate(self):
+        pass
+
+    # register a secondary index on key(record); must be idempotent.
+    # With multi=True key(record) returns a list of keys, all of which find the record.
+    # With ordered=True the index also serves scan(); its keys must be strings.
+    def add_index(self, name, key, unique=False, multi=False, ordered=False):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __contains__(self, record_id):
+        return self.get(record_id) is not None
+
+    def get(self, record_id):
+        raise NotImplementedError
+
+    # first record matching value on the given index, or None
+    def find(self, index, value):
+        records = self.find_all(index, value)
+        return records[0] if records else None
+
+    # all records matching value on the given index, in insertion order
+    def find_all(self, index, value):
+        raise NotImplementedError
+
+    # number of records matching value on the given index, without reading them
+    def count(self, index, value):
+        return len(self.find_all(index, value))
+
+    def values(self):
+        raise NotImplementedError
+
+    # iterate over every record without materializing them all at once where the backend allows it
+    def iter_values(self, batch_size=1000):
+        return iter(self.values())
+
+    # (key, record) pairs of an ordered index in (key, id) order, with low <= key < high
+    # and, to resume a previous scan, strictly after the (key, id) pair `after`
+    def scan(self, index, low=None, high=None, after=None):
+        raise NotImplementedError
+
+    def insert(self, record):
+        raise NotImplementedError
+
+    # set fields on an existing record
+    def update(self, record_id, fields):
+        raise NotImplementedError
+
+    # remove fields from an existing record
+    def unset(self, record_id, fields):
+        raise NotImplementedError
+
+    # append items to a list field
+    def extend(self, record_id, field, items):
+        raise NotImplementedError
+
+    # write out anything still buffered in memory, see JsonCollection.deferred
+    def flush(self):
+        pass
+
+    def append(self, record_id, field, item):
+        return self.extend(record_id, field, [item])
+
+    def transaction(self):
+        """
+        Context manager that makes a read-check-write sequence atomic across
+        threads and processes, e.g. a uniqueness check followed by an insert.
+        Records must be read inside it, since it may reload them. Everything
+        written inside is committed in one write when the outermost
+        transaction exits, and discarded if it exits with an exception.
+        """
+        raise NotImplementedError
+
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_writes():
+    """
+    Defer the disk writes of every JSON transaction committed by this thread
+    until the collection is flushed.
+    """
+    previous = getattr(_deferred, "active", False)
+    _deferred.active = True
+    try:
+        yield
+    finally:
+        _deferred.active = previous
+
+
+_nonblocking = threading.local()
+
+
+class WouldBlock(Exception):
+    """
+    Raised inside nonblocking() where a JSON collection would have to go to disk.
+    """
+
+
+@contextmanager
+def nonblocking():
+    """
+    Have this thread's JSON collections raise WouldBlock instead of taking a
+    file lock or reading a file: a reload after another process's write, a
+    transaction or the first open of a collection (e.g. a board's tasks).
+    A read that gets through is answered from memory, see async_api.
+    """
+    previous = getattr(_nonblocking, "active", False)
+    _nonblocking.active = True
+    try:
+        yield
+    finally:
+        _nonblocking.active = previous
+
+
+def _check_blocking(what):
+    if getattr(_nonblocking, "active", False):
+        raise WouldBlock(what)
+
+
+class JsonCollection(Collection):
+    """
+    In-memory, indexed view of a JSON file holding a list of records.
+
+    The file is parsed once when the collection is opened; it may also be
+    minified JSON or the binary format, see ENCODINGS. A missing (or empty)
+    file is an empty collection and is created by the first write; a file
+    that can't be parsed raises ValueError and is left alone. Records are kept in
+    a dict keyed by their "id" and secondary hash indexes can be registered on
+    any derived key, so lookups never touch the disk.
+
+    Every mutation is an operation (insert, update, unset or extend). By default an
+    operation rewrites the whole snapshot file. In journal mode it is appended
+    as one JSON line to "<path>.log" instead, and the log is folded into the
+    snapshot every `compact_every` operations. A log left behind is replayed
+    on load whatever the mode; a torn last line (a crash mid-append) is cut
+    off then, so later appends start on a line of their own.
+
+    Several processes can share one db directory. Loading takes a shared
+    lock on "<path>.lock" and writing an exclusive one; snapshots are written
+    to a temp file and renamed over the old one. The version (mtime, size and
+    inode of the snapshot and log) seen at load time is checked before every
+    write and the collection is reloaded first if another process has written
+    since, so no write is ever lost. Reads are served from memory without
+    waiting for writers; revalidate() does the same version check for
+    readers. Other threads only ever see committed data: while a
+    transaction is open, a record it changed reads as it was before, and a
+    change is made on a copy of the record, so one handed out earlier keeps
+    its committed contents. Operations
+    made inside a transaction are buffered and written together when it
+    commits; if that write fails the transaction is rolled back like on any
+    other error, so memory never holds what the disk doesn't.
+
+    With deferred set (or inside deferred_writes() on the current thread), a
+    committed transaction only updates memory and its operations wait for
+    flush(), so many commits share one write (used by the async facade). The
+    next non-deferred write also writes them out. Deferred operations survive
+    a reload caused by another process writing; they are re-applied on top of
+    the fresh data. Until then they were only checked against this process's
+    view, so a deferred operation that now clashes with what another process
+    wrote (a taken unique key, a record that already exists) is dropped and
+    reported on stderr: across processes, the write that reaches disk first
+    wins.
+
+    Durability of a write once the call returns:
+      * default: the snapshot is fsync'd, a journal line is handed to the OS
+        (survives the process dying, not the machine losing power)
+      * group commit (group_commit()): only in memory until the next flush,
+        which happens every flush_interval seconds, as soon as flush_size
+        operations are waiting, on flush() and at interpreter exit; a crash
+        loses at most that window
+    """
+
+    def __init__(self, path, journal=False, compact_every=1000, encoding=None, record_type=None):
+        self.path = path
+        # records.Record subclass records are kept as in memory, plain dicts if None
+        self.record_type = record_type
+        self.log_path = path + ".log"
+        self.journal = journal
+        # snapshot encoding to write, None keeps the one the file is in
+        self.encoding = encoding
+        self._file_encoding = "json"
+        self.compact_every = compact_every
+        self._lock = FileLock(path + ".lock")
+        self._depth = 0
+        # thread of the open transaction, and the committed version of every
+        # record it changed so far, for reads from other threads
+        self._owner = None
+        self._before = {}
+        self._mutex = threading.Lock()
+        self._version = None
+        self._log_size = 0
+        self._pending = []
+        self.deferred = False
+        self.flush_interval = None
+        self.flush_size = None
+        self._last_flush = time.monotonic()
+        self._unflushed = []
+        # operations committed / durably written so far, lets flushes be coalesced
+        self.committed = 0
+        self.flushed = 0
+        self._records = {}
+        self._indexes = {}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._load()
+
+    # identity of the files on disk, changes whenever any process writes them
+    def _stamp(self):
+        stamp = []
+        for path in (self.path, self.log_path):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _load(self):
+        started = time.perf_counter()
+        if self._stamp() == (None, None):
+            # nothing written yet, e.g. a board without tasks; reading it creates no lock file either
+            records, torn = {}, None
+            self._log_size = 0
+            self._version = (None, None)
+        else:
+            with self._lock.shared():
+                records, torn = self._read()
+        if torn is not None:
+            # a torn last line has to go before anything is appended after it. Read
+            # again under the exclusive lock, another process may have cut it already.
+            with self._lock.exclusive():
+                records, torn = self._read()
+                if torn is not None:
+                    with open(self.log_path, "r+b") as f:
+                        f.truncate(torn)
+                    self._version = self._stamp()
+        instrumentation.record_io("load", started, sum(st[1] for st in self._version if st))
+
+        self._records = records
+        self.generation += 1
+        for index in self._indexes.values():
+            index.rebuild(records.values())
+        # deferred operations go back on top, checked again: another process may have
+        # written a record with the same unique key meanwhile, and what is on disk wins
+        unflushed, self._unflushed = self._unflushed, []
+        for op in unflushed:
+            conflict = self._conflict(op)
+            if conflict is not None:
+                sys.stderr.write(f"Dropped a deferred write to {self.path}: {conflict}\n")
+                continue
+            self._apply(op)
+            self._unflushed.append(op)
+
+        # outside journal mode a leftover log is folded in straight away
+        if self._log_size and not self.journal:
+            self.compact()
+
+    # parse the snapshot and replay the log, with the lock held. Returns the records
+    # and the length the log must be cut back to if it ends in a torn line, else None.
+    def _read(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            # a new collection, its first write creates the file
+            data = b""
+        records = []
+        if data:
+            try:
+                records, self._file_encoding = decode_records(data)
+            except ValueError as e:
+                # never replaced, it may well be the only copy of the data
+                raise ValueError(f"Corrupt db file {self.path}: {e}")
+
+        # build the new state aside and swap it in, so readers in other threads never see it half done
+        if self.record_type is not None:
+            records = map(self.record_type.from_dict, records)
+        records = {record["id"]: record for record in records}
+        ops, torn = self._read_log()
+        for op in ops:
+            self._replay(records, op)
+        self._log_size = len(ops)
+        self._version = self._stamp()
+        return records, torn
+
+    def _read_log(self):
+        try:
+            with open(self.log_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return [], None
+
+        ops = []
+        end = 0
+        lines = data.splitlines(keepends=True)
+        for i, line in enumerate(lines):
+            try:
+                op = json.loads(line) if line.endswith(b"\n") else None
+            except ValueError:
+                op = None
+            if op is None:
+                if i < len(lines) - 1:
+                    raise ValueError(f"Corrupt journal {self.log_path} at line {i + 1}")
+                # a torn last line from a crash mid-append, it was never acknowledged
+                return ops, end
+            ops.append(op)
+            end += len(line)
+        return ops, None
+
+    def revalidate(self):
+        if self._stamp() != self._version:
+            # reloads under the exclusive lock, so no write of another thread is lost in the swap
+            with self.transaction():
+                pass
+
+    def add_index(self, name, key, unique=False, multi=False, ordered=False):
+        if name in self._indexes:
+            return
+        index = _SortedIndex(key) if ordered else _Index(key, unique, multi)
+        index.rebuild(self.values())
+        self._indexes[name] = index
+
+    # what other threads must see instead of the open transaction's changes:
+    # record id -> committed record (None if inserted by it), else None
+    def _undone(self):
+        if self._before and self._owner != threading.get_ident():
+            with self._mutex:
+                return dict(self._before)
+        return None
+
+    def __len__(self):
+        if self._undone() is None:
+            return len(self._records)
+        return len(self.values())
+
+    def __contains__(self, record_id):
+        return self.get(record_id) is not None
+
+    # the records are read before the changes to undo, a transaction that has
+    # ended in between committed what was read
+    def get(self, record_id):
+        record = self._records.get(record_id)
+        before = self._undone()
+        if before is not None and record_id in before:
+            return before[record_id]
+        return record
+
+    def find(self, index, value):
+        records = self.find_all(index, value)
+        return records[0] if records else None
+
+    def find_all(self, index, value):
+        records = self._records
+        index = self._indexes[index]
+        found = [records.get(record_id) for record_id in index.ids(value)]
+        before = self._undone()
+        if before is not None:
+            found = [record for record in found if record is not None and record["id"] not in before]
+            found += [record for record in before.values() if record is not None and value in index._values(record)]
+        return [record for record in found if record is not None]
+
+    def count(self, index, value):
+        if self._undone() is None:
+            return self._indexes[index].count(value)
+        return len(self.find_all(index, value))
+
+    # a snapshot list, safe to iterate while another thread writes
+    def values(self):
+        records = list(self._records.values())
+        before = self._undone()
+        if before is None:
+            return records
+        found = [before.get(record["id"], record) for record in records]
+        return [record for record in found if record is not None]
+
+    def scan(self, index, low=None, high=None, after=None):
+        records = self._records
+        before = self._undone()
+        index = self._indexes[index]
+        entries = index.scan(low, high, after)
+        if before is not None:
+            # the index holds the open transaction's keys, the committed ones are merged back in
+            committed = sorted(
+                (key, record["id"]) for record in before.values() if record is not None
+                for key in index._values(record)
+                if (low is None or key >= low) and (high is None or key < high)
+                and (after is None or (key, record["id"]) > tuple(after))
+            )
+            entries = heapq.merge((entry for entry in entries if entry[1] not in before), committed)
+        for key, record_id in entries:
+            if before is not None and record_id in before:
+                record = before[record_id]
+            else:
+                record = records.get(record_id)
+            if record is not None:
+                yield key, record
+
+    def insert(self, record):
+        if record["id"] in self._records:
+            raise ValueError(f"Record {record['id']} already exists")
+        if self.record_type is not None:
+            record = self.record_type.from_dict(record)
+        return self._commit({"op": "insert", "record": record})
+
+    def update(self, record_id, fields):
+        if record_id not in self._records:
+            raise KeyError(record_id)
+        return self._commit({"op": "update", "id": record_id, "fields": fields})
+
+    def unset(self, record_id, fields):
+        if record_id not in self._records:
+            raise KeyError(record_id)
+        return self._commit({"op": "unset", "id": record_id, "fields": list(fields)})
+
+    # in journal mode only the new items are logged
+    def extend(self, record_id, field, items):
+        if record_id not in self._records:
+            raise KeyError(record_id)
+        return self._commit({"op": "extend", "id": record_id, "field": field, "items": list(items)})
+
+    # apply a logged operation to a records dict being loaded
+    def _replay(self, records, op):
+        if op["op"] in ("append", "extend"):
+            # a crash between writing a snapshot and removing the log replays
+            # items that are already in the snapshot, skip those
+            op = self._unseen_items(records, op)
+        if op["op"] == "insert":
+            record = op["record"]
+            if self.record_type is not None:
+                record = self.record_type.from_dict(record)
+            records[record["id"]] = record
+        else:
+            apply_change(records[op["id"]], op)
+
+    # why op can no longer be applied to the in-memory records, or None
+    def _conflict(self, op):
+        if op["op"] == "insert":
+            record = op["record"]
+            if record["id"] in self._records:
+                return f"record {record['id']} already exists"
+        elif op["id"] not in self._records:
+            return f"record {op['id']} does not exist"
+        elif op["op"] == "update":
+            record = dict(self._records[op["id"]])
+            record.update(op["fields"])
+        else:
+            return None
+        for name, index in self._indexes.items():
+            if isinstance(index, _Index) and index.unique:
+                for value in index._values(record):
+                    owner = index.entries.get(value)
+                    if owner is not None and owner != record["id"]:
+                        return f"{name} {value!r} already belongs to record {owner}"
+        return None
+
+    # apply an operation to the in-memory records, without touching disk
+    def _apply(self, op):
+        if op["op"] == "insert":
+            record = op["record"]
+            self._records[record["id"]] = record
+            for index in self._indexes.values():
+                index.add(record)
+            return record
+
+        # changed on a copy: readers holding the record keep the committed version
+        old = self._records[op["id"]]
+        record = old.copy() if self.record_type is not None else dict(old)
+        apply_change(record, op)
+        for index in self._indexes.values():
+            index.remove(old)
+            index.add(record)
+        self._records[record["id"]] = record
+        return record
+
+    @contextmanager
+    def transaction(self):
+        _check_blocking(f"transaction on {self.path}")
+        with self._lock.exclusive():
+            self._depth += 1
+            self._owner = threading.get_ident()
+            try:
+                if self._depth == 1 and self._stamp() != self._version:
+                    self._load()
+                yield self
+                if self._depth == 1 and self._pending:
+                    self.committed += len(self._pending)
+                    if self.deferred or getattr(_deferred, "active", False):
+                        self._unflushed.extend(self._pending)
+                        self._pending = []
+                        if self.flush_size and len(self._unflushed) >= self.flush_size:
+                            self._flush_unflushed()
+                    else:
+                        # earlier deferred operations go first so the log keeps commit order
+                        earlier = self._unflushed
+                        self._pending, self._unflushed = earlier + self._pending, []
+                        try:
+                            self._write_pending()
+                        except BaseException:
+                            # the earlier ones stay queued, this transaction's own are rolled back below
+                            self._pending, self._unflushed = self._pending[len(earlier):], earlier
+                            self.committed -= len(self._pending)
+                            raise
+            except BaseException:
+                if self._depth == 1 and self._pending:
+                    # roll back by reloading what is on disk
+                    self._pending = []
+                    self._load()
+                raise
+            finally:
+                self._depth -= 1
+                if not self._depth and self._before:
+                    with self._mutex:
+                        self._before = {}
+
+    def _unseen_items(self, records, op):
+        items = op["items"] if op["op"] == "extend" else [op["item"]]
+        seen = {
+            item["id"] for item in records[op["id"]].get(op["field"], [])
+            if isinstance(item, dict) and "id" in item
+        }
+        items = [item for item in items if not (isinstance(item, dict) and item.get("id") in seen)]
+        return {"op": "extend", "id": op["id"], "field": op["field"], "items": items}
+
+    def _commit(self, op):
+        with self.transaction():
+            record_id = op["record"]["id"] if op["op"] == "insert" else op["id"]
+            with self._mutex:
+                self._before.setdefault(record_id, self._records.get(record_id))
+                record = self._apply(op)
+            self._pending.append(op)
+            return record
+
+    # keep mutations in memory and write them in batches, see the class docstring
+    def group_commit(self, flush_interval, flush_size=1000):
+        self.deferred = True
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        _committer.register(self)
+
+    def flush(self):
+        with self.transaction():
+            self._flush_unflushed()
+
+    # drop the deferred operations, nothing of them was written: reloading what is on
+    # disk undoes them in memory too
+    def discard(self):
+        with self.transaction():
+            self.committed -= len(self._unflushed)
+            self._unflushed = []
+            self._load()
+
+    def _flush_unflushed(self):
+        self._last_flush = time.monotonic()
+        if not self._unflushed:
+            return
+        ops, self._unflushed = self._unflushed, []
+        self._pending = ops
+        try:
+            self._write_pending()
+        except BaseException:
+            # keep them for the next attempt instead of letting the transaction roll them back
+            self._unflushed = ops + self._unflushed
+            self._pending = []
+            raise
+
+    # write every buffered operation in one go. They stay pending until the
+    # write went through, so a failed one is rolled back by the transaction.
+    def _write_pending(self):
+        ops = self._pending
+        if not self.journal:
+            self.save()
+        elif self._version[0] is None:
+            # a log always goes with a snapshot, so the first write of a new collection writes one
+            self.compact()
+        else:
+            started = time.perf_counter()
+            data = "".join(json.dumps(op, default=plain) + "\n" for op in ops)
+            with open(self.log_path, "a") as f:
+                f.write(data)
+                f.flush()
+            instrumentation.record_io("dump", started, len(data))
+            self._log_size += len(ops)
+            if self._log_size >= self.compact_every:
+                self.compact()
+            self._version = self._stamp()
+        self._pending = []
+        self.flushed = self.committed
+
+    def save(self):
+        with self.transaction():
+            started = time.perf_counter()
+            encoding = self.encoding or self._file_encoding
+            data = encode_records(list(self._records.values()), encoding)
+            atomic_write(self.path, data)
+            instrumentation.record_io("dump", started, len(data))
+            self._file_encoding = encoding
+            self._version = self._stamp()
+
+    # fold the journal into a fresh snapshot and start an empty log
+    def compact(self):
+        with self.transaction():
+            self.save()
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+            self._log_size = 0
+            self._version = self._stamp()
+
+
+class _GroupCommitter:
+    """
+    Background thread that flushes group commit collections once their
+    flush_interval has passed since their last flush.
+    """
+
+    def __init__(self):
+        self._collections = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def register(self, collection):
+        with self._lock:
+            if collection not in self._collections:
+                self._collections.append(collection)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                collections = list(self._collections)
+            time.sleep(min(c.flush_interval for c in collections))
+            now = time.monotonic()
+            for collection in collections:
+                if collection._unflushed and now - collection._last_flush >= collection.flush_interval:
+                    try:
+                        collection.flush()
+                    except Exception as e:
+                        # the operations stay queued and are retried on the next tick
+                        sys.stderr.write(f"Group commit flush of {collection.path} failed: {e}\n")
+
+
+_committer = _GroupCommitter()
+_collections = {}
+
+
+def unflushed_collections():
+    """
+    Open collections holding deferred operations that have not been flushed yet.
+    """
+    return [c for c in list(_collections.values()) if getattr(c, "_unflushed", None)]
+
+
+def flush_all():
+    """
+    Flush every open collection, e.g. before a planned shutdown.
+    """
+    for collection in unflushed_collections():
+        collection.flush()
+
+
+def discard_all():
+    """
+    Drop the deferred operations of every open collection instead of writing
+    them, e.g. when a batch group fails, see Dispatcher.group.
+    """
+    for collection in unflushed_collections():
+        collection.discard()
+
+
+atexit.register(flush_all)
+
+
+def open_collection(path, journal=False, backend="json", shard=None, flush_interval=None, flush_size=1000,
+                    encoding=None, record_type=None):
+    """
+    Return the shared Collection for a db file, loading it on first use.
+
+    Managers living in the same process get the same instance, so a file is
+    parsed once no matter how many managers read it. Asking for journal mode
+    switches a shared JSON collection into it; it is never switched back.
+
+    backend is "json" (the db/*.json files), "sqlite" (one table per
+    collection in db/planner.sqlite3, see sqlite_storage.py) or "mmap" (a
+    db/<name>.rec record file and db/<name>.idx id index per collection,
+    see mmap_storage.py; created from the JSON file on first use).
+
+    A shard is an independently loaded slice of a collection, e.g. the tasks
+    of one board. For the json backend shard "x" of db/tasks.json is the file
+    db/tasks/x.json; for sqlite it is the rows of the tasks table tagged "x".
+
+    A flush_interval (seconds) puts a JSON collection in group commit mode,
+    see JsonCollection. sqlite and mmap commit every transaction and ignore it.
+
+    encoding picks the format JSON snapshots are written in, see ENCODINGS.
+    Files in any format are read; None keeps each file's current format.
+
+    record_type (see records.py) is the class a JSON collection keeps its
+    records as in memory, to save memory over plain dicts. The other
+    backends decode records per call and always return dicts.
+    """
+    if backend not in ("json", "sqlite", "mmap"):
+        raise ValueError(f"Unknown storage backend {backend}")
+    if encoding is not None and encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding {encoding}, must be one of {', '.join(ENCODINGS)}")
+    if shard is not None and (not shard or os.sep in shard or shard.startswith(".")):
+        raise ValueError(f"Invalid shard name {shard}")
+
+    key = (backend, os.path.abspath(path), shard)
+    collection = _collections.get(key)
+    if collection is None:
+        if backend == "json":
+            _check_blocking(f"opening {path}")
+        if backend == "sqlite":
+            from sqlite_storage import SqliteCollection
+            collection = SqliteCollection(path, shard=shard)
+        elif backend == "mmap":
+            from mmap_storage import MmapCollection
+            collection = MmapCollection(path, shard=shard)
+        elif shard is not None:
+            collection = JsonCollection(
+                os.path.join(os.path.splitext(path)[0], f"{shard}.json"),
+                journal=journal, encoding=encoding, record_type=record_type
+            )
+        else:
+            collection = JsonCollection(path, journal=journal, encoding=encoding, record_type=record_type)
+        _collections[key] = collection
+    elif backend == "json":
+        if journal:
+            collection.journal = True
+        if encoding is not None:
+            collection.encoding = encoding
+    if flush_interval is not None and backend == "json" and not collection.flush_interval:
+        collection.group_commit(flush_interval, flush_size)
+    return collection
@@ -1,21 +1,19 @@
 from team_base import TeamBase
+from manager import StoredManager
+from paging import list_page
+from cache import cached, responses
 import json
-import os
 import datetime
 import uuid
 
-class TeamManager(TeamBase):
+class TeamManager(TeamBase, StoredManager):
 
-    def __init__(self, db_path="db/teams.json"):
-        self.db_path = db_path
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-
-        try:
-            with open(self.db_path, "r") as f:
-                json.load(f)
-        except Exception as e:
-            with open(self.db_path, "w") as f:
-                f.write("[]")
+    # storage_options: see StoredManager
+    def __init__(self, db_path="db/teams.json", **storage_options):
+        super().__init__(db_path, **storage_options)
+        self.teams = self._open_teams(self.db_path)
+        # users live next to the teams file, same as UserManager's default
+        self.users = self._open_users(self._db_file("users.json"))
 
     def create_team(self, request: str) -> str:
         data = json.loads(request)
@@ -35,40 +33,39 @@ class TeamManager(TeamBase):
         if len(description) > 128:
             raise ValueError("Description cannot be more than 128 characters")
 
-        with open(self.db_path, "r") as f:
-            team_records = json.load(f)
-
-        # Unique team name check
-        for record in team_records:
-            if record["name"].lower() == name.lower():
+        with self.teams.transaction():
+            # Unique team name check
+            if self.teams.find("name", name.lower()) is not None:
                 raise RuntimeError(f"Team '{name}' already exists")
 
-        team_id = str(uuid.uuid4())
+            team_id = str(uuid.uuid4())
 
-        team_data = {
-            "id": team_id,
-            "name": name,
-            "description": description,
-            "admin": admin_id,
-            "creation_time": datetime.datetime.now().isoformat()
-        }
-
-        team_records.append(team_data)
+            team_data = {
+                "id": team_id,
+                "name": name,
+                "description": description,
+                "admin": admin_id,
+                "creation_time": datetime.datetime.now().isoformat()
+            }
 
-        with open(self.db_path, "w") as f:
-            json.dump(team_records, f, indent=2)
+            self.teams.insert(team_data)
+        responses.invalidate(self.teams)
 
         return json.dumps({"id": team_id})
 
-    def list_teams(self) -> str:
-        
-        try:
-            with open(self.db_path, "r") as f:
-                teams = json.load(f)
+    @cached("teams", lambda self, data: [(self.teams, None)])
+    def list_teams(self, request: str = None) -> str:
+        # filters and pagination, see paging.list_page
+        if request is not None:
+            return list_page(
+                self.teams, json.loads(request), (), "name_order", "created",
+                ["name", "description", "creation_time", "admin"]
+            )
 
+        try:
             filtered_team_data= []
             
-            for team in teams:
+            for team in self.teams.values():
                 obj = {
                     "name":team["name"],
                     "description":team["description"],
@@ -82,6 +79,7 @@ class TeamManager(TeamBase):
         except Exception as e:
             raise RuntimeError(f"Failed to fetch teams {e}")
         
+    @cached("teams", lambda self, data: [(self.teams, data["id"])])
     def describe_team(self, request: str) -> str:
         data = json.loads(request)
 
@@ -90,21 +88,18 @@ class TeamManager(TeamBase):
 
         team_id = data["id"]
 
-        with open(self.db_path, "r") as f:
-            teams = json.load(f)
+        team = self.teams.get(team_id)
 
-        for team in teams:
-            if team["id"] == team_id:
-                
-                obj = {
-                    "name": team["name"],
-                    "description": team["description"],
-                    "creation_time": team["creation_time"],
-                    "admin": team["admin"]
-                }
-                return json.dumps(obj, indent=2)
+        if team is None:
+            raise RuntimeError(f"No team found with id {team_id}")
 
-        raise RuntimeError(f"No team found with id {team_id}")
+        obj = {
+            "name": team["name"],
+            "description": team["description"],
+            "creation_time": team["creation_time"],
+            "admin": team["admin"]
+        }
+        return json.dumps(obj, indent=2)
     
     def update_team(self, request: str) -> str:
         data = json.loads(request)
@@ -125,30 +120,20 @@ class TeamManager(TeamBase):
         if len(description) > 128:
             raise ValueError("Description can not be more than 128 characters")
 
-        with open(self.db_path, "r") as f:
-            teams = json.load(f)
-
-        updated = False
+        with self.teams.transaction():
+            team = self.teams.get(team_id)
 
-        for team in teams:
-            if team["id"] == team_id:
-                
-                if team["name"] != name:
-                    for other in teams:
-                        if other["id"] != team_id and other["name"] == name:
-                            raise RuntimeError("Team name already exists")
-                    team["name"] = name
+            if team is None:
+                raise RuntimeError(f"No team found with id {team_id}")
 
-                team["description"] = description
-                team["admin"] = admin_id
-                updated = True
-                break
+            if team["name"] != name:
+                other = self.teams.find("name", name.lower())
+                # case-insensitively, like create_team: the name index keeps one team per lowercase name
+                if other is not None and other["id"] != team_id:
+                    raise RuntimeError("Team name already exists")
 
-        if not updated:
-            raise RuntimeError(f"No team found with id {team_id}")
-
-        with open(self.db_path, "w") as f:
-            json.dump(teams, f, indent=2)
+            self.teams.update(team_id, {"name": name, "description": description, "admin": admin_id})
+        responses.invalidate(self.teams, team_id)
 
         return json.dumps({"id": team_id, "message": "Team updated successfully"})
     
@@ -164,32 +149,19 @@ class TeamManager(TeamBase):
         if not isinstance(new_users, list):
             raise ValueError("'users' must be a list")
 
-        with open(self.db_path, "r") as f:
-            teams = json.load(f)
+        with self.teams.transaction():
+            team = self.teams.get(team_id)
 
-        updated = False
+            if team is None:
+                raise RuntimeError(f"No team found with id {team_id}")
 
-        for team in teams:
-            if team["id"] == team_id:
-                
-                if "users" not in team:
-                    team["users"] = []
+            # Combine old and new users without duplicates
+            combined_users = list(set(team.get("users", []) + new_users))
 
-                # Combine old and new users without duplicates
-                combined_users = list(set(team["users"] + new_users))
+            if len(combined_users) > 50:
+                raise RuntimeError("Cannot have more than 50 users in a team")
 
-                if len(combined_users) > 50:
-                    raise RuntimeError("Cannot have more than 50 users in a team")
-
-                team["users"] = combined_users
-                updated = True
-                break
-
-        if not updated:
-            raise RuntimeError(f"No team found with id {team_id}")
-
-        with open(self.db_path, "w") as f:
-            json.dump(teams, f, indent=2)
+            self.teams.update(team_id, {"users": combined_users})
 
         return json.dumps({"id": team_id, "message": "Users added successfully"})
 
@@ -205,27 +177,15 @@ class TeamManager(TeamBase):
         if not isinstance(remove_users, list):
             raise ValueError("'users' must be a list")
 
-        with open(self.db_path, "r") as f:
-            teams = json.load(f)
-
-        updated = False
+        with self.teams.transaction():
+            team = self.teams.get(team_id)
 
-        for team in teams:
-            if team["id"] == team_id:
-                if "users" not in team:
-                    team["users"] = []
+            if team is None:
+                raise RuntimeError(f"No team found with id {team_id}")
 
-                # Remove specified users
-                team["users"] = [u for u in team["users"] if u not in remove_users]
-
-                updated = True
-                break
-
-        if not updated:
-            raise RuntimeError(f"No team found with id {team_id}")
-
-        with open(self.db_path, "w") as f:
-            json.dump(teams, f, indent=2)
+            # Remove specified users
+            remove_users = set(remove_users)
+            self.teams.update(team_id, {"users": [u for u in team.get("users", []) if u not in remove_users]})
 
         return json.dumps({"id": team_id, "message": "Users removed successfully"})
 
@@ -237,15 +197,9 @@ class TeamManager(TeamBase):
 
         team_id = data["id"]
 
-        # Read teams
-        with open(self.db_path, "r") as f:
-            teams = json.load(f)
-
-        team_found = None
-        for team in teams:
-            if team["id"] == team_id:
-                team_found = team
-                break
+        self.teams.revalidate()
+        self.users.revalidate()
+        team_found = self.teams.get(team_id)
 
         if not team_found:
             raise RuntimeError(f"No team found with id {team_id}")
@@ -253,24 +207,16 @@ class TeamManager(TeamBase):
         if "users" not in team_found or not team_found["users"]:
             return json.dumps([])  
 
-        user_db_path = "db/users.json"  # same path used in UserManager
-        if not os.path.exists(user_db_path):
-            raise RuntimeError("Users database not found")
-
-        with open(user_db_path, "r") as f:
-            all_users = json.load(f)
-
         # Filter only users present in this team
         team_users_info = []
         for uid in team_found["users"]:
-            for user in all_users:
-                if user["id"] == uid:
-                    team_users_info.append({
-                        "id": user["id"],
-                        "name": user["name"],
-                        "display_name": user["display_name"]
-                    })
-                    break
+            user = self.users.get(uid)
+            if user is not None:
+                team_users_info.append({
+                    "id": user["id"],
+                    "name": user["name"],
+                    "display_name": user["display_name"]
+                })
 
         return json.dumps(team_users_info, indent=2)
 
@@ -24,7 +24,7 @@ class TeamBase:
         pass
 
     # list all teams
-    def list_teams(self) -> str:
+    def list_teams(self, request: str = None) -> str:
         """
         :return: A json list with the response.
         [
@@ -35,6 +35,25 @@ class TeamBase:
             "admin": "<id of a user>"
           }
         ]
+
+        With a request the listing is filtered and sorted by name; every key is optional.
+        "created_from" is inclusive, "created_until" exclusive. "fields" picks the fields
+        returned for each team. With a "limit" the response is one page, pass its
+        "next_cursor" back as "cursor" to get the next one (null on the last page):
+        :param request:
+        {
+          "name_prefix" : "<start of the name>",
+          "created_from" : "<date:time>",
+          "created_until" : "<date:time>",
+          "fields" : ["<field>", ...],
+          "limit" : <page size>,
+          "cursor" : "<next_cursor of the previous page>"
+        }
+        :return:
+        {
+          "items" : [<team as above>, ...],
+          "next_cursor" : "<cursor>" | null
+        }
         """
         pass
 
@@ -0,0 +1,975 @@
+import asyncio
+import base64
+import csv
+import http.client
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import storage
+from async_api import AsyncProjectBoard
+from cache import responses
+from dispatch import Dispatcher
+import instrumentation
+from main import run_batch
+from project_board import ProjectBoard
+from search import tokenize
+from server import PlannerServer
+from team import TeamManager
+from user import UserManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BatchItemsTest(unittest.TestCase):
+    """
+    A bad item of a batch call is answered with an error, the others still go through.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db = os.path.join(self.tmp.name, "db")
+        self.users = UserManager(os.path.join(db, "users.json"))
+        self.boards = ProjectBoard(os.path.join(db, "boards.json"))
+        self.board_id = json.loads(
+            self.boards.create_board(json.dumps({"name": "b", "description": "", "team_id": "t1"}))
+        )["id"]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_create_users(self):
+        results = json.loads(self.users.create_users(json.dumps([
+            1, None, {"name": None, "display_name": "x"}, {"name": "alice", "display_name": "Alice"},
+        ])))
+        self.assertEqual(["error" in result for result in results], [True, True, True, False])
+
+    def test_add_tasks(self):
+        task = {"title": "t", "description": "", "user_id": "u1", "board_id": self.board_id}
+        results = json.loads(self.boards.add_tasks(json.dumps([
+            "t", dict(task, title=None), dict(task, board_id=[1]), task,
+        ])))
+        self.assertEqual(["error" in result for result in results], [True, True, True, False])
+        summary = json.loads(self.boards.board_summary(json.dumps({"id": self.board_id})))
+        self.assertEqual(summary["total_tasks"], 1)
+
+    def test_update_task_statuses(self):
+        task_id = json.loads(self.boards.add_task(json.dumps(
+            {"title": "t", "description": "", "user_id": "u1", "board_id": self.board_id}
+        )))["id"]
+        results = json.loads(self.boards.update_task_statuses(json.dumps([
+            [task_id], {"id": [task_id], "status": "COMPLETE"}, {"id": task_id, "status": "COMPLETE"},
+        ])))
+        self.assertEqual(["error" in result for result in results], [True, True, False])
+
+
+class StartupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "db")
+        self.path = os.path.join(self.db, "boards.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_task_index_is_rebuilt_once(self):
+        boards = ProjectBoard(self.path)
+        for i in range(3):
+            boards.create_board(json.dumps({"name": f"b{i}", "description": "", "team_id": "t1"}))
+
+        rebuilds = []
+        reopened = ProjectBoard.__new__(ProjectBoard)
+        reopened._rebuild_task_index = lambda: rebuilds.append(True)
+        reopened.__init__(self.path)
+        self.assertEqual(rebuilds, [])
+        # boards without tasks have no task files, opening the db didn't create any
+        self.assertFalse(os.path.exists(os.path.join(self.db, "tasks")))
+
+    def test_db_from_before_the_index_is_indexed(self):
+        boards = ProjectBoard(self.path)
+        board_id = json.loads(boards.create_board(json.dumps({"name": "b", "description": "", "team_id": "t1"})))["id"]
+        task_id = json.loads(boards.add_task(json.dumps(
+            {"title": "t", "description": "", "user_id": "u1", "board_id": board_id}
+        )))["id"]
+        for name in ("meta.json", "task_index.json"):
+            os.remove(os.path.join(self.db, name))
+
+        # a fresh process, not the collections this one has loaded
+        subprocess_code = (
+            "import json, sys; from project_board import ProjectBoard; "
+            "print(ProjectBoard(sys.argv[1]).list_user_tasks(json.dumps({'id': 'u1'})))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", subprocess_code, self.path], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual([t["id"] for t in json.loads(output)], [task_id])
+
+
+class SearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "db")
+        self.path = os.path.join(self.db, "boards.json")
+        self.boards = ProjectBoard(self.path)
+        self.board_ids = {
+            name: json.loads(self.boards.create_board(json.dumps(
+                {"name": name, "description": "", "team_id": team_id}
+            )))["id"]
+            for name, team_id in (("web", "t1"), ("api", "t1"), ("ops", "t2"))
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def add_task(self, board, title, description=""):
+        request = {"title": title, "description": description, "user_id": "u1", "board_id": self.board_ids[board]}
+        return json.loads(self.boards.add_task(json.dumps(request)))["id"]
+
+    def search(self, query, **scope):
+        return [t["title"] for t in json.loads(self.boards.search_tasks(json.dumps(dict(scope, query=query))))]
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Fix the LOGIN-page, asap! (v2_beta)"), ["fix", "the", "login", "page", "asap", "v2_beta"])
+
+    def test_every_word_must_match(self):
+        self.add_task("web", "Fix login bug")
+        self.add_task("web", "Fix logout")
+        self.add_task("web", "Login page", "needs a fix")
+        self.assertEqual(sorted(self.search("fix LOGIN")), ["Fix login bug", "Login page"])
+        self.assertEqual(self.search("login missing"), [])
+        with self.assertRaises(ValueError):
+            self.search(" ?! ")
+
+    def test_ranked_by_tf_idf(self):
+        self.add_task("web", "bug report", "bug")
+        self.add_task("web", "code report", "a bug in the code")
+        self.add_task("web", "weekly report", "report")
+        # a term counts more the larger its share of the task's words
+        self.assertEqual(self.search("bug"), ["bug report", "code report"])
+        self.assertEqual(self.search("report"), ["weekly report", "bug report", "code report"])
+        self.assertEqual(self.search("report", limit=1), ["weekly report"])
+        found = json.loads(self.boards.search_tasks(json.dumps({"query": "report bug"})))
+        self.assertEqual([t["title"] for t in found], ["bug report", "code report"])
+        self.assertGreater(found[0]["score"], found[1]["score"])
+        self.assertEqual(self.search("weekly bug"), [])
+
+        # the same number of words each, the rarer word weighs more
+        self.add_task("api", "alpha", "alpha common")
+        self.add_task("api", "common", "alpha common")
+        self.add_task("api", "only", "common")
+        self.assertEqual(self.search("common alpha"), ["alpha", "common"])
+
+    def test_scoped_to_a_team_or_board(self):
+        for board in self.board_ids:
+            self.add_task(board, f"deploy {board}")
+        self.assertEqual(sorted(self.search("deploy", team_id="t1")), ["deploy api", "deploy web"])
+        self.assertEqual(self.search("deploy", board_id=self.board_ids["ops"]), ["deploy ops"])
+        self.assertEqual(self.search("deploy", team_id="t2", board_id=self.board_ids["web"]), [])
+
+    def test_index_is_rebuilt_once(self):
+        self.add_task("web", "old task")
+        self.add_task("api", "older task")
+        # a db from before search, or whose index missed tasks: only some entries, no rebuild recorded
+        index = os.path.join(self.db, "search_index.json")
+        entries = storage.JsonCollection(index).values()
+        for path in (index, index + ".log", os.path.join(self.db, "meta.json")):
+            if os.path.exists(path):
+                os.remove(path)
+        with open(index, "w") as f:
+            json.dump([dict(entry) for entry in entries if entry["board_id"] == self.board_ids["web"]], f)
+
+        # a fresh process, not the collections this one has loaded
+        subprocess_code = (
+            "import json, sys; from project_board import ProjectBoard; "
+            "print(ProjectBoard(sys.argv[1]).search_tasks(json.dumps({'query': 'task'})))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", subprocess_code, self.path], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(sorted(t["title"] for t in json.loads(output)), ["old task", "older task"])
+
+        subprocess_code = (
+            "import sys; from project_board import ProjectBoard; "
+            "ProjectBoard._rebuild_search_index = lambda self: print('rebuilt'); ProjectBoard(sys.argv[1])"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", subprocess_code, self.path], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(output, "")
+
+
+class UserTasksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.boards = ProjectBoard(os.path.join(self.tmp.name, "db", "boards.json"))
+        self.board_ids = [
+            json.loads(self.boards.create_board(json.dumps({"name": f"b{i}", "description": "", "team_id": "t1"})))["id"]
+            for i in range(3)
+        ]
+        # u1 has tasks on the first two boards, the third only holds u2's
+        self.task_ids = {}
+        for board_id, title, user_id in (
+            (self.board_ids[0], "open one", "u1"),
+            (self.board_ids[0], "done one", "u1"),
+            (self.board_ids[1], "closed one", "u1"),
+            (self.board_ids[2], "not mine", "u2"),
+        ):
+            request = {"title": title, "description": "", "user_id": user_id, "board_id": board_id}
+            self.task_ids[title] = json.loads(self.boards.add_task(json.dumps(request)))["id"]
+        for title in ("done one", "closed one"):
+            self.boards.update_task_status(json.dumps({"id": self.task_ids[title], "status": "COMPLETE"}))
+        self.boards.close_board(json.dumps({"id": self.board_ids[1]}))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def titles(self, **filters):
+        tasks = json.loads(self.boards.list_user_tasks(json.dumps(dict(filters, id="u1"))))
+        return sorted(t["title"] for t in tasks)
+
+    def test_filters(self):
+        self.assertEqual(self.titles(), ["closed one", "done one", "open one"])
+        self.assertEqual(self.titles(status="COMPLETE"), ["closed one", "done one"])
+        self.assertEqual(self.titles(board_status="OPEN"), ["done one", "open one"])
+        self.assertEqual(self.titles(board_status="CLOSED"), ["closed one"])
+        self.assertEqual(self.titles(status="OPEN", board_status="CLOSED"), [])
+        tasks = json.loads(self.boards.list_user_tasks(json.dumps({"id": "u1", "board_status": "CLOSED"})))
+        self.assertEqual((tasks[0]["board_id"], tasks[0]["board_name"]), (self.board_ids[1], "b1"))
+        for bad in ({"status": "DONE"}, {"board_status": "OPENED"}):
+            with self.subTest(request=bad), self.assertRaises(ValueError):
+                self.titles(**bad)
+
+    def test_only_the_users_boards_are_opened(self):
+        with mock.patch.object(self.boards, "_tasks", wraps=self.boards._tasks) as opened:
+            self.titles()
+        self.assertEqual({call.args[0] for call in opened.call_args_list}, set(self.board_ids[:2]))
+        self.assertEqual(opened.call_count, 2)
+
+
+class TeamNamesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.teams = TeamManager(os.path.join(self.tmp.name, "db", "teams.json"))
+        self.ids = {
+            name: json.loads(self.teams.create_team(json.dumps({"name": name, "description": "", "admin": "u1"})))["id"]
+            for name in ("Alpha", "Beta")
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def rename(self, name, new_name):
+        self.teams.update_team(json.dumps({"id": self.ids[name], "team": {"name": new_name, "description": "", "admin": "u1"}}))
+
+    def test_rename_to_a_case_variant_of_another_team(self):
+        with self.assertRaises(RuntimeError):
+            self.rename("Beta", "alpha")
+        with self.assertRaises(RuntimeError):
+            self.teams.create_team(json.dumps({"name": "ALPHA", "description": "", "admin": "u1"}))
+        self.assertEqual(sorted(t["name"] for t in json.loads(self.teams.list_teams())), ["Alpha", "Beta"])
+
+    def test_rename_to_a_case_variant_of_its_own_name(self):
+        self.rename("Beta", "BETA")
+        self.assertEqual(sorted(t["name"] for t in json.loads(self.teams.list_teams())), ["Alpha", "BETA"])
+
+
+class MembershipTest(unittest.TestCase):
+    """
+    Teams joined through TeamManager are found by UserManager.get_user_teams, also in another process.
+    """
+
+    def check_backend(self, backend):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = os.path.join(tmp, "db")
+            users = UserManager(os.path.join(db, "users.json"), backend=backend)
+            user_id = json.loads(users.create_user(json.dumps({"name": "alice", "display_name": "Alice"})))["id"]
+            # a process with only a TeamManager
+            subprocess_code = (
+                "import json, sys; from team import TeamManager; "
+                "teams = TeamManager(sys.argv[1], backend=sys.argv[2]); "
+                "team_id = json.loads(teams.create_team(json.dumps({'name': 'a', 'description': '', 'admin': sys.argv[3]})))['id']; "
+                "teams.add_users_to_team(json.dumps({'id': team_id, 'users': [sys.argv[3]]}))"
+            )
+            subprocess.run(
+                [sys.executable, "-c", subprocess_code, os.path.join(db, "teams.json"), backend, user_id],
+                cwd=ROOT, check=True
+            )
+            teams = json.loads(users.get_user_teams(json.dumps({"id": user_id})))
+            self.assertEqual([team["name"] for team in teams], ["a"])
+
+    def test_json(self):
+        self.check_backend("json")
+
+    def test_sqlite(self):
+        self.check_backend("sqlite")
+
+    def test_mmap(self):
+        self.check_backend("mmap")
+
+
+class PagingTests:
+    """
+    Filters and cursor pages of list_users, list_teams and list_boards; subclasses pick the backend.
+    """
+
+    backend = None
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db = os.path.join(self.tmp.name, "db")
+        self.users = UserManager(os.path.join(db, "users.json"), backend=self.backend)
+        self.teams = TeamManager(os.path.join(db, "teams.json"), backend=self.backend)
+        self.boards = ProjectBoard(os.path.join(db, "boards.json"), backend=self.backend)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    # every page of a listing, following the cursors
+    def pages(self, list_call, request):
+        pages = []
+        cursor = None
+        while True:
+            page = json.loads(list_call(json.dumps(dict(request, cursor=cursor))))
+            pages.append(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    def create_board(self, name, created, team_id="t1"):
+        request = {"name": name, "description": "", "team_id": team_id, "creation_time": created}
+        return json.loads(self.boards.create_board(json.dumps(request)))["id"]
+
+    def test_users_by_name_prefix_and_fields(self):
+        for name in ("bob", "anna", "carl", "ann", "andy"):
+            self.users.create_user(json.dumps({"name": name, "display_name": name.title()}))
+
+        pages = self.pages(self.users.list_users, {"limit": 2, "fields": ["name"]})
+        self.assertEqual(pages, [[{"name": "andy"}, {"name": "ann"}], [{"name": "anna"}, {"name": "bob"}], [{"name": "carl"}]])
+        page = json.loads(self.users.list_users(json.dumps({"name_prefix": "ann", "limit": 5})))
+        self.assertEqual([user["name"] for user in page["items"]], ["ann", "anna"])
+        self.assertEqual(set(page["items"][0]), {"name", "display_name", "creation_time"})
+        self.assertIsNone(page["next_cursor"])
+
+    def test_teams_by_creation_time(self):
+        for name in ("x", "y", "z"):
+            self.teams.create_team(json.dumps({"name": name, "description": "", "admin": "u1"}))
+        created = {team["name"]: team["creation_time"] for team in json.loads(self.teams.list_teams())}
+
+        request = {"created_from": created["y"], "limit": 1, "fields": ["name"]}
+        self.assertEqual(self.pages(self.teams.list_teams, request), [[{"name": "y"}], [{"name": "z"}]])
+        request = {"created_until": created["y"], "name_prefix": ""}
+        self.assertEqual([team["name"] for team in json.loads(self.teams.list_teams(json.dumps(request)))], ["x"])
+
+    def test_boards_sharing_a_creation_time_are_paged_by_id(self):
+        board_ids = [self.create_board(f"b{i}", "2026-01-02T00:00:00") for i in range(5)]
+        self.create_board("early", "2026-01-01T00:00:00")
+        self.create_board("late", "2026-01-03T00:00:00")
+        self.create_board("elsewhere", "2026-01-02T00:00:00", team_id="t2")
+
+        request = {
+            "id": "t1", "created_from": "2026-01-02T00:00:00", "created_until": "2026-01-03T00:00:00",
+            "limit": 2, "fields": ["id"],
+        }
+        pages = self.pages(self.boards.list_boards, request)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([board["id"] for page in pages for board in page], sorted(board_ids))
+
+    def test_boards_by_status(self):
+        open_id = self.create_board("open", "2026-01-01T00:00:00")
+        closed_id = self.create_board("closed", "2026-01-02T00:00:00")
+        self.boards.close_board(json.dumps({"id": closed_id}))
+
+        listed = json.loads(self.boards.list_boards(json.dumps({"id": "t1", "status": "CLOSED"})))
+        self.assertEqual(listed, [{"id": closed_id, "name": "closed"}])
+        listed = json.loads(self.boards.list_boards(json.dumps({"id": "t1", "limit": 5})))
+        self.assertEqual(listed["items"], [{"id": open_id, "name": "open"}])
+        with self.assertRaises(ValueError):
+            self.boards.list_boards(json.dumps({"id": "t1", "status": "DONE"}))
+
+    def test_bad_requests_are_refused(self):
+        self.create_board("b", "2026-01-01T00:00:00")
+        page = json.loads(self.boards.list_boards(json.dumps({"id": "t1", "limit": 1, "name_prefix": ""})))
+        name_cursor = base64.urlsafe_b64encode(json.dumps(["team_status_name", "t1", "x"]).encode()).decode()
+        bad = [
+            {"limit": 0},
+            {"limit": "2"},
+            {"fields": "name"},
+            {"name_prefix": 5},
+            {"created_from": 20260101},
+            {"cursor": "not a cursor"},
+            {"cursor": base64.urlsafe_b64encode(b"[1, 2, 3]").decode()},
+            {"cursor": base64.urlsafe_b64encode(b'["team_status_created", 5, "x"]').decode(), "created_from": "2026"},
+            {"cursor": base64.urlsafe_b64encode(b'{"a": 1, "b": 2, "c": 3}').decode()},
+            # a name cursor on a creation time listing
+            {"cursor": name_cursor, "created_from": "2026"},
+        ]
+        self.assertIsNone(page["next_cursor"])
+        for request in bad:
+            with self.subTest(request=request), self.assertRaises(ValueError):
+                self.boards.list_boards(json.dumps(dict(request, id="t1")))
+
+
+class JsonPagingTest(PagingTests, unittest.TestCase):
+    backend = "json"
+
+
+class SqlitePagingTest(PagingTests, unittest.TestCase):
+    backend = "sqlite"
+
+
+class MmapPagingTest(PagingTests, unittest.TestCase):
+    backend = "mmap"
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """
+    A write drops the cached responses built from what it changed, and only those.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "db")
+        self.users = UserManager(os.path.join(self.db, "users.json"))
+        self.teams = TeamManager(os.path.join(self.db, "teams.json"))
+        self.boards = ProjectBoard(os.path.join(self.db, "boards.json"))
+        responses.clear()
+
+    def tearDown(self):
+        responses.clear()
+        self.tmp.cleanup()
+
+    # call every read once so its response is cached, then report which of them
+    # are still served from the cache after write()
+    def served_from_cache(self, reads, write):
+        for read, request in reads:
+            read(*request)
+        write()
+        still = []
+        for read, request in reads:
+            hits = responses.hits
+            read(*request)
+            if responses.hits > hits:
+                still.append((read.__name__,) + request)
+        return still
+
+    def create_team(self, name):
+        request = {"name": name, "description": "", "admin": "u1"}
+        return json.loads(self.teams.create_team(json.dumps(request)))["id"]
+
+    def create_board(self, name, team_id):
+        request = {"name": name, "description": "", "team_id": team_id}
+        return json.loads(self.boards.create_board(json.dumps(request)))["id"]
+
+    def test_team_writes(self):
+        first, second = self.create_team("a"), self.create_team("b")
+        describe = [(self.teams.describe_team, (json.dumps({"id": team_id}),)) for team_id in (first, second)]
+        reads = [(self.teams.list_teams, ()), (self.users.list_users, ())] + describe
+
+        def update():
+            self.teams.update_team(json.dumps({"id": first, "team": {"name": "a2", "description": "", "admin": "u1"}}))
+        still = self.served_from_cache(reads, update)
+        self.assertEqual(still, [("list_users",), ("describe_team", json.dumps({"id": second}))])
+        self.assertEqual(json.loads(self.teams.describe_team(json.dumps({"id": first})))["name"], "a2")
+
+    def test_user_writes(self):
+        alice = json.loads(self.users.create_user(json.dumps({"name": "alice", "display_name": "Alice"})))["id"]
+        reads = [(self.users.list_users, ()), (self.users.list_users, ('{"limit": 1}',)), (self.teams.list_teams, ())]
+
+        def update():
+            self.users.update_user(json.dumps({"id": alice, "user": {"name": "alice", "display_name": "Al"}}))
+        self.assertEqual(self.served_from_cache(reads, update), [("list_teams",)])
+        self.assertEqual(json.loads(self.users.list_users())[0]["display_name"], "Al")
+
+        def create():
+            self.users.create_users(json.dumps([{"name": "bob", "display_name": "Bob"}]))
+        self.assertEqual(self.served_from_cache(reads, create), [("list_teams",)])
+        self.assertEqual(len(json.loads(self.users.list_users())), 2)
+
+    def test_board_writes(self):
+        closing = self.create_board("b", "t2")
+        reads = [
+            (self.boards.list_boards, (json.dumps({"id": "t1"}),)),
+            (self.boards.list_boards, (json.dumps({"id": "t2"}),)),
+            (self.teams.list_teams, ()),
+        ]
+        still = self.served_from_cache(reads, lambda: self.create_board("a", "t1"))
+        self.assertEqual(still, [("list_boards", json.dumps({"id": "t2"})), ("list_teams",)])
+
+        still = self.served_from_cache(reads, lambda: self.boards.close_board(json.dumps({"id": closing})))
+        self.assertEqual(still, [("list_boards", json.dumps({"id": "t1"})), ("list_teams",)])
+        self.assertEqual(json.loads(self.boards.list_boards(json.dumps({"id": "t2"}))), [])
+
+    def test_write_of_another_process(self):
+        self.create_team("a")
+        self.teams.list_teams()
+        misses = responses.misses
+        subprocess_code = (
+            "import json, sys; from team import TeamManager; "
+            "TeamManager(sys.argv[1]).create_team(json.dumps({'name': 'b', 'description': '', 'admin': 'u1'}))"
+        )
+        subprocess.run([sys.executable, "-c", subprocess_code, os.path.join(self.db, "teams.json")], cwd=ROOT, check=True)
+
+        # the reload bumps the generation, the entry built before it is not used
+        generation = self.teams.teams.generation
+        names = [team["name"] for team in json.loads(self.teams.list_teams())]
+        self.assertEqual(names, ["a", "b"])
+        self.assertGreater(self.teams.teams.generation, generation)
+        self.assertEqual(responses.misses, misses + 1)
+
+
+class TaskCountsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "db")
+        self.path = os.path.join(self.db, "boards.json")
+        self.boards = ProjectBoard(self.path)
+        self.board_id = json.loads(
+            self.boards.create_board(json.dumps({"name": "b", "description": "", "team_id": "t1"}))
+        )["id"]
+        self.task_id = json.loads(self.boards.add_task(json.dumps(
+            {"title": "t", "description": "", "user_id": "u1", "board_id": self.board_id}
+        )))["id"]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def summary(self):
+        return json.loads(self.boards.board_summary(json.dumps({"id": self.board_id})))["task_counts"]
+
+    def test_status_update_leaves_the_catalog_alone(self):
+        with open(self.path, "rb") as f:
+            catalog = f.read()
+        stamp = os.stat(self.path).st_mtime_ns
+        self.boards.update_task_status(json.dumps({"id": self.task_id, "status": "COMPLETE"}))
+        self.assertEqual(self.summary(), {"OPEN": 0, "IN_PROGRESS": 0, "COMPLETE": 1})
+        self.assertEqual(os.stat(self.path).st_mtime_ns, stamp)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), catalog)
+
+    # make every snapshot write under db/<directory> fail
+    def failing_writes(self, directory):
+        atomic_write = storage.atomic_write
+
+        def write(path, data):
+            if os.path.basename(os.path.dirname(path)) == directory:
+                raise OSError(28, "No space left on device")
+            return atomic_write(path, data)
+
+        return mock.patch.object(storage, "atomic_write", write)
+
+    def test_failed_task_write_is_not_counted(self):
+        with self.failing_writes("tasks"), self.assertRaises(OSError):
+            self.boards.update_task_status(json.dumps({"id": self.task_id, "status": "COMPLETE"}))
+        self.assertEqual(self.summary(), {"OPEN": 1, "IN_PROGRESS": 0, "COMPLETE": 0})
+        with self.assertRaises(ValueError):
+            self.boards.close_board(json.dumps({"id": self.board_id}))
+
+    def test_close_board_puts_counters_right(self):
+        # the task went to disk, its counters didn't
+        with self.failing_writes("task_counts"), self.assertRaises(OSError):
+            self.boards.update_task_status(json.dumps({"id": self.task_id, "status": "COMPLETE"}))
+        self.assertEqual(self.summary(), {"OPEN": 1, "IN_PROGRESS": 0, "COMPLETE": 0})
+
+        self.boards.close_board(json.dumps({"id": self.board_id}))
+        self.assertEqual(self.summary(), {"OPEN": 0, "IN_PROGRESS": 0, "COMPLETE": 1})
+
+    def test_counters_in_the_catalog_are_moved(self):
+        # a db from when the catalog held the counters
+        with open(self.path) as f:
+            catalog = json.load(f)
+        catalog[0]["task_counts"] = {"OPEN": 0, "IN_PROGRESS": 1, "COMPLETE": 0}
+        with open(self.path, "w") as f:
+            json.dump(catalog, f)
+        os.remove(os.path.join(self.db, "meta.json"))
+        os.remove(os.path.join(self.db, "task_counts", f"{self.board_id}.json"))
+
+        subprocess_code = (
+            "import json, sys; from project_board import ProjectBoard; "
+            "print(ProjectBoard(sys.argv[1]).board_summary(json.dumps({'id': sys.argv[2]})))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", subprocess_code, self.path, self.board_id],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(json.loads(output)["task_counts"], {"OPEN": 0, "IN_PROGRESS": 1, "COMPLETE": 0})
+        with open(self.path) as f:
+            self.assertNotIn("task_counts", json.load(f)[0])
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "db")
+        self.users = UserManager(os.path.join(self.db, "users.json"))
+        instrumentation.reset()
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+        self.tmp.cleanup()
+
+    def test_counters_and_phases(self):
+        original = UserManager.create_user
+        instrumentation.enable()
+        self.assertIsNot(UserManager.create_user, original)
+        self.users.create_user(json.dumps({"name": "alice", "display_name": "Alice"}))
+        with self.assertRaises(ValueError):
+            self.users.create_user(json.dumps({"name": "x" * 65, "display_name": "X"}))
+        self.users.list_users()
+
+        stats = instrumentation.stats()
+        created = stats["UserManager.create_user"]
+        self.assertEqual((created["calls"], created["errors"]), (2, 1))
+        self.assertEqual(sum(created["histogram_ms"].values()), 2)
+        self.assertGreater(created["bytes_written"], 0)
+        self.assertGreater(created["phases_ms"]["dump"], 0)
+        # the phases split the time of the calls
+        self.assertAlmostEqual(sum(created["phases_ms"].values()), created["total_ms"], delta=0.5)
+        listed = stats["UserManager.list_users"]
+        self.assertEqual((listed["calls"], listed["errors"], listed["bytes_written"]), (1, 0, 0))
+
+        instrumentation.disable()
+        self.assertIs(UserManager.create_user, original)
+        self.users.create_user(json.dumps({"name": "bob", "display_name": "Bob"}))
+        # kept after disable, and nothing more recorded
+        self.assertEqual(instrumentation.stats()["UserManager.create_user"]["calls"], 2)
+
+    def test_io_outside_a_call_and_profile(self):
+        path = os.path.join(self.db, "other", "users.json")
+        storage.JsonCollection(path).insert({"id": "u1", "name": "alice", "display_name": "Alice", "creation_time": ""})
+        instrumentation.enable(profile=True)
+        # opening a manager reads its files outside any API call
+        users = UserManager(path)
+        self.assertGreater(instrumentation.stats()["(background)"]["bytes_read"], 0)
+        users.list_users()
+        self.assertIn("list_users", instrumentation.profile_report())
+        self.assertEqual(instrumentation.stats()["(background)"]["calls"], 0)
+
+
+class AsyncReadsTest(unittest.TestCase):
+    """
+    json backend reads run on the event loop only while they are answered from memory.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.boards = ProjectBoard(os.path.join(self.tmp.name, "db", "boards.json"))
+        self.board_id = json.loads(
+            self.boards.create_board(json.dumps({"name": "b", "description": "", "team_id": "t1"}))
+        )["id"]
+        self.boards.add_task(json.dumps({"title": "t", "description": "", "user_id": "u1", "board_id": self.board_id}))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    # the threads JsonCollection._load ran on while calling method
+    def loads(self, method, request):
+        threads = []
+        load = storage.JsonCollection._load
+
+        def recording_load(collection):
+            threads.append(threading.current_thread())
+            return load(collection)
+
+        async def call():
+            return await getattr(AsyncProjectBoard(self.boards), method)(request)
+
+        with mock.patch.object(storage.JsonCollection, "_load", recording_load):
+            result = asyncio.run(call())
+        return json.loads(result), threads
+
+    def test_shard_open_goes_to_the_pool(self):
+        # the board's tasks have not been opened by this process yet
+        shard = self.boards._tasks(self.board_id)
+        for key, collection in list(storage._collections.items()):
+            if collection is shard:
+                del storage._collections[key]
+
+        tasks, threads = self.loads("list_user_tasks", json.dumps({"id": "u1"}))
+        self.assertEqual([t["title"] for t in tasks], ["t"])
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_reload_goes_to_the_pool(self):
+        # another process's write, seen as a changed file
+        path = self.boards.boards.path
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        boards, threads = self.loads("list_boards", json.dumps({"id": "t1"}))
+        self.assertEqual([b["name"] for b in boards], ["b"])
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+
+class AsyncWritesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.boards = ProjectBoard(os.path.join(self.tmp.name, "db", "boards.json"))
+        self.board_id = json.loads(
+            self.boards.create_board(json.dumps({"name": "b", "description": "", "team_id": "t1"}))
+        )["id"]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_one_event_loop_after_another(self):
+        async def add(run):
+            boards = AsyncProjectBoard(self.boards)
+            return await asyncio.gather(*[
+                boards.add_task(json.dumps(
+                    {"title": f"t{run}-{i}", "description": "", "user_id": "u1", "board_id": self.board_id}
+                ))
+                for i in range(20)
+            ])
+
+        for run in range(2):
+            self.assertEqual(len(asyncio.run(add(run))), 20)
+        summary = json.loads(self.boards.board_summary(json.dumps({"id": self.board_id})))
+        self.assertEqual(summary["total_tasks"], 40)
+
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server = PlannerServer(("127.0.0.1", 0), Dispatcher(os.path.join(self.tmp.name, "db")))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.connection = http.client.HTTPConnection(*self.server.server_address)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def post(self, method, body):
+        self.connection.request("POST", f"/{method}", body=body)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_wrong_shape_is_refused_on_the_same_connection(self):
+        for method, body in (("create_user", "[1]"), ("create_users", '{"name": "a"}'), ("describe_user", '"x"')):
+            status, response = self.post(method, body)
+            self.assertEqual(status, 400)
+            self.assertIn("error", response)
+        status, response = self.post("create_user", json.dumps({"name": "alice", "display_name": "Alice"}))
+        self.assertEqual(status, 200)
+        self.assertIn("id", response)
+
+
+class RunBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dispatcher = Dispatcher(os.path.join(self.tmp.name, "db"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_lines(self, *commands):
+        out = io.StringIO()
+        failed = run_batch([json.dumps(command) for command in commands], out, self.dispatcher)
+        return failed, [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def create_user(self, name):
+        return {"method": "create_user", "request": {"name": name, "display_name": name.title()}}
+
+    def test_group_and_flush(self):
+        writes = []
+        original = storage.JsonCollection._write_pending
+
+        def counting(collection):
+            writes.append(os.path.basename(collection.path))
+            return original(collection)
+        with mock.patch.object(storage.JsonCollection, "_write_pending", counting):
+            failed, results = self.run_lines(
+                {"method": "group"},
+                self.create_user("alice"),
+                self.create_user("bob"),
+                {"method": "flush"},
+            )
+        self.assertEqual(failed, 0)
+        self.assertEqual(writes, ["users.json"])
+        with open(os.path.join(self.tmp.name, "db", "users.json")) as f:
+            self.assertEqual(sorted(u["name"] for u in json.load(f)), ["alice", "bob"])
+
+    def test_failed_command_rolls_the_group_back(self):
+        failed, results = self.run_lines(
+            self.create_user("carol"),
+            {"method": "group"},
+            self.create_user("alice"),
+            {"method": "create_board", "request": {"name": "b", "description": "", "team_id": "t1"}},
+            self.create_user("alice"),
+            self.create_user("bob"),
+            {"method": "flush"},
+            {"method": "list_users"},
+            {"method": "list_boards", "request": {"id": "t1"}},
+        )
+        self.assertEqual(failed, 3)
+        self.assertEqual(results[4]["error"], "User already exists with same name")
+        self.assertEqual(results[5]["error"], "Skipped, the group was rolled back at line 5")
+        self.assertEqual(results[6]["error"], "Nothing written, the group was rolled back at line 5")
+        self.assertEqual([u["name"] for u in results[7]["result"]], ["carol"])
+        self.assertEqual(results[8]["result"], [])
+        # nor on disk, and the next group starts afresh
+        subprocess_code = "import sys; from user import UserManager; print(UserManager(sys.argv[1]).list_users())"
+        other = subprocess.run(
+            [sys.executable, "-c", subprocess_code, os.path.join(self.tmp.name, "db", "users.json")],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual([u["name"] for u in json.loads(other)], ["carol"])
+        failed, results = self.run_lines({"method": "group"}, self.create_user("alice"), {"method": "flush"})
+        self.assertEqual(failed, 0)
+
+    def test_rollback_keeps_writes_made_before_the_group(self):
+        # group commit defers every write, the ones before the group are flushed when it opens
+        self.dispatcher = Dispatcher(os.path.join(self.tmp.name, "db"), flush_interval=60)
+        failed, results = self.run_lines(
+            self.create_user("carol"),
+            {"method": "group"},
+            self.create_user("alice"),
+            {"method": "create_user", "request": {"name": "alice"}},
+            {"method": "flush"},
+            {"method": "list_users"},
+        )
+        self.assertEqual(failed, 2)
+        self.assertEqual([u["name"] for u in results[5]["result"]], ["carol"])
+
+    def test_flush_without_group(self):
+        failed, results = self.run_lines({"method": "flush"})
+        self.assertEqual(failed, 1)
+        self.assertEqual(results[0]["error"], "No group to flush")
+
+
+class ExportBoardsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        # exports go to out/ under the working directory
+        os.chdir(self.tmp.name)
+        self.boards = ProjectBoard(os.path.join("db", "boards.json"))
+        self.teams = {}
+        for team_id in ("t1", "t2"):
+            self.teams[team_id] = [
+                json.loads(self.boards.create_board(json.dumps(
+                    {"name": f"b{i}", "description": "", "team_id": team_id}
+                )))["id"]
+                for i in range(3)
+            ]
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_concurrent_calls_get_their_own_files(self):
+        results = {}
+
+        def export(team_id):
+            request = json.dumps({"team_id": team_id, "workers": 2, "format": "csv"})
+            results[team_id] = json.loads(self.boards.export_boards(request))["out_files"]
+
+        threads = [threading.Thread(target=export, args=(team_id,)) for team_id in self.teams]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for team_id, board_ids in self.teams.items():
+            self.assertEqual(results[team_id], [f"out/board_{board_id}.csv" for board_id in board_ids])
+            for path in results[team_id]:
+                self.assertTrue(os.path.exists(path))
+
+    # a closed board with a task whose description needs escaping
+    def closed_board(self):
+        board_id = self.teams["t1"][0]
+        description = 'line one\nline, "two"'
+        request = {"title": "task", "description": description, "user_id": "u1", "board_id": board_id}
+        task_id = json.loads(self.boards.add_task(json.dumps(request)))["id"]
+        self.boards.update_task_status(json.dumps({"id": task_id, "status": "COMPLETE"}))
+        self.boards.close_board(json.dumps({"id": board_id}))
+        return self.boards.boards.get(board_id), self.boards._tasks(board_id).get(task_id)
+
+    def export(self, board_id, fmt):
+        path = json.loads(self.boards.export_board(json.dumps({"id": board_id, "format": fmt})))["out_file"]
+        self.assertEqual(path, f"out/board_{board_id}.{fmt}")
+        with open(path, newline="") as f:
+            return f.read()
+
+    def test_csv_shape(self):
+        board, task = self.closed_board()
+        rows = list(csv.reader(io.StringIO(self.export(board["id"], "csv"))))
+        self.assertEqual(rows, [
+            ["board_id", "board_name", "task_id", "title", "description", "status", "user_id", "creation_time"],
+            [board["id"], "b0", task["id"], "task", 'line one\nline, "two"', "COMPLETE", "u1", task["creation_time"]],
+        ])
+
+    def test_jsonl_shape(self):
+        board, task = self.closed_board()
+        lines = self.export(board["id"], "jsonl").splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0]), dict(board))
+        self.assertEqual(json.loads(lines[0])["end_time"], board["end_time"])
+        self.assertEqual(json.loads(lines[1]), dict(task, board_id=board["id"]))
+
+    def test_txt_shows_when_the_board_closed(self):
+        board, _ = self.closed_board()
+        closed = f"Status: CLOSED\nCreated: {board['creation_time']}\nClosed: {board['end_time']}\n"
+        self.assertIn(closed, self.export(board["id"], "txt"))
+        self.assertNotIn("Closed:", self.export(self.teams["t1"][1], "txt"))
+        with self.assertRaises(ValueError):
+            self.boards.export_board(json.dumps({"id": board["id"], "format": "xml"}))
+
+    def test_workers_on_a_single_thread_use_a_pool(self):
+        for i, board_id in enumerate(self.teams["t1"]):
+            self.boards.add_task(json.dumps(
+                {"title": f"task {i}", "description": "a, \"quoted\" one", "user_id": "u1", "board_id": board_id}
+            ))
+        # a fresh process, this one runs the threads of earlier tests
+        subprocess_code = (
+            "import json, sys; sys.path.insert(0, sys.argv[1]); import export; "
+            "from project_board import ProjectBoard; "
+            "pools = []; Pool = export.ProcessPoolExecutor; "
+            "export.ProcessPoolExecutor = lambda *args, **kwargs: pools.append(args) or Pool(*args, **kwargs); "
+            "boards = ProjectBoard('db/boards.json'); "
+            "out = boards.export_boards(json.dumps({'team_id': 't1', 'workers': 2, 'format': 'csv'})); "
+            "print(json.dumps({'pools': len(pools), 'out_files': json.loads(out)['out_files']}))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", subprocess_code, ROOT], cwd=self.tmp.name, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output)
+        self.assertEqual(result["pools"], 1)
+        self.assertEqual(result["out_files"], [f"out/board_{board_id}.csv" for board_id in self.teams["t1"]])
+        for i, path in enumerate(result["out_files"]):
+            with open(path, newline="") as f:
+                rows = list(csv.reader(f))
+            self.assertEqual(rows[0][:4], ["board_id", "board_name", "task_id", "title"])
+            self.assertEqual([row[3:5] for row in rows[1:]], [[f"task {i}", 'a, "quoted" one']])
+
+    def test_threaded_process_writes_the_boards_itself(self):
+        with mock.patch("threading.active_count", return_value=2), \
+                mock.patch("export.ProcessPoolExecutor") as pool:
+            out = json.loads(self.boards.export_boards(json.dumps({"team_id": "t2", "workers": 2})))["out_files"]
+        pool.assert_not_called()
+        self.assertEqual(out, [f"out/board_{board_id}.txt" for board_id in self.teams["t2"]])
+        for path in out:
+            self.assertTrue(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,38 +1,30 @@
 from user_base import UserBase
-import os
+from manager import StoredManager
+from paging import list_page
+from cache import cached, responses
 import json
 import uuid
 import datetime
 
-class UserManager(UserBase):
-
-    def __init__(self, db_path="db/users.json"):
-        self.db_path = db_path
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        
-        try:
-            with open(self.db_path, "r") as f:
-                json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            with open(self.db_path, "w") as f:
-                f.write("[]")
+class UserManager(UserBase, StoredManager):
 
+    # storage_options: see StoredManager
+    def __init__(self, db_path="db/users.json", **storage_options):
+        super().__init__(db_path, **storage_options)
+        self.users = self._open_users(self.db_path)
+        # teams live next to the users file, same as TeamManager's default
+        self.teams = self._open_teams(self._db_file("teams.json"))
 
-    # create a user
-    def create_user(self, request: str) -> str:
-        data = json.loads(request)
+    # validate a create request and build the user record, without storing it
+    def _new_user(self, data):
         name = data["name"]
         display_name = data["display_name"]
 
         if len(name)>64 or len(display_name)>64:
             raise ValueError("Name or Display Name is too long")
-        
-        with open(self.db_path, "r") as f:
-            users = json.load(f)
 
-        for user in users:
-            if user["name"]==name:
-                raise ValueError("User already exists with same name")
+        if self.users.find("name", name) is not None:
+            raise ValueError("User already exists with same name")
             
         date_time = datetime.datetime.now().isoformat()
             
@@ -40,7 +32,7 @@ class UserManager(UserBase):
         
         user_id = str(uuid.uuid4())
 
-        user_data = {
+        return {
             "id": user_id,
             "name": name,
             "display_name": display_name,
@@ -48,20 +40,59 @@ class UserManager(UserBase):
             "creation_time": date_time
         }
 
-        users.append(user_data)
-
-        with open(self.db_path, "w") as f:
-            json.dump(users, f, indent=2)
+    # create a user
+    def create_user(self, request: str) -> str:
+        data = json.loads(request)
 
-        return json.dumps({"id": user_id})
+        # check and insert under one lock so concurrent workers can't both take the name
+        with self.users.transaction():
+            user_data = self._new_user(data)
+            self.users.insert(user_data)
+        responses.invalidate(self.users)
+
+        return json.dumps({"id": user_data["id"]})
+
+    # create many users, validated one by one and committed in a single write
+    def create_users(self, request: str) -> str:
+        requests = json.loads(request)
+
+        if not isinstance(requests, list):
+            raise ValueError("Request must be a list of users")
+
+        results = []
+        with self.users.transaction():
+            for data in requests:
+                try:
+                    user_data = self._new_user(data)
+                except KeyError as e:
+                    results.append({"error": f"Missing required field: {e}"})
+                    continue
+                except ValueError as e:
+                    results.append({"error": str(e)})
+                    continue
+                except (TypeError, AttributeError) as e:
+                    # not an object, or a field of the wrong type
+                    results.append({"error": f"Invalid user: {e}"})
+                    continue
+
+                # inserted right away, so later names in the batch are checked against it
+                self.users.insert(user_data)
+                results.append({"id": user_data["id"]})
+        responses.invalidate(self.users)
+
+        return json.dumps(results)
     
-    def list_users(self) -> str:
+    @cached("users", lambda self, data: [(self.users, None)])
+    def list_users(self, request: str = None) -> str:
+        # filters and pagination, see paging.list_page
+        if request is not None:
+            return list_page(
+                self.users, json.loads(request), (), "name_order", "created",
+                ["name", "display_name", "creation_time"]
+            )
         try:
-            with open(self.db_path, "r") as f:
-                users = json.load(f)
-
             filtered_users = []
-            for user in users:
+            for user in self.users.values():
                 obj = {
                     "name":user["name"],
                     "display_name":user["display_name"],
@@ -75,25 +106,18 @@ class UserManager(UserBase):
     def describe_user(self, request: str) -> str:
         data = json.loads(request)
         id = data["id"]
+        self.users.revalidate()
        
         try:
-            with open(self.db_path, "r") as f:
-                records = json.load(f)
-
-            found = False
+            record = self.users.get(id)
 
-            for record in records:
-                if record["id"] == id:
-                    description = record["description"]
-                    name = record["name"]
-                    creation_time = record["creation_time"]
-                    
-                    found = True
-                    break
-
-            if not found:
+            if record is None:
                 raise RuntimeError("There is no record with this id")
 
+            description = record["description"]
+            name = record["name"]
+            creation_time = record["creation_time"]
+
 
             return json.dumps({"name":name,
                                "description":description,
@@ -118,24 +142,17 @@ class UserManager(UserBase):
             raise ValueError("Display name can not be greater than 128 characters")
 
         try:
-            with open(self.db_path, "r") as f:
-                records = json.load(f)
+            with self.users.transaction():
+                record = self.users.get(id)
 
-            updated = False
+                if record is None:
+                    raise RuntimeError("There is no record with this id")
 
-            for record in records:
-                if record["id"] == id:
-                    if record["name"] != name:
-                        raise RuntimeError("Name can not be updated")
-                    record["display_name"] = display_name
-                    updated = True
-                    break
+                if record["name"] != name:
+                    raise RuntimeError("Name can not be updated")
 
-            if not updated:
-                raise RuntimeError("There is no record with this id")
-
-            with open(self.db_path, "w") as f:
-                json.dump(records, f, indent=2)
+                self.users.update(id, {"display_name": display_name})
+            responses.invalidate(self.users, id)
 
             return json.dumps({"id": id, "message": "User Updated Successfully"})
 
@@ -148,22 +165,14 @@ class UserManager(UserBase):
         data = json.loads(request)
         user_id = data["id"]
 
-        team_db_path = "db/teams.json"
-        if not os.path.exists(team_db_path):
-            raise RuntimeError("No teams database found")
-
-        with open(team_db_path, "r") as f:
-            teams = json.load(f)
-
         user_teams = []
-        for team in teams:
-            # Check if 'users' key exists and contains this user
-            if "users" in team and user_id in team["users"]:
-                user_teams.append({
-                    "name": team["name"],
-                    "description": team["description"],
-                    "creation_time": team["creation_time"]
-                })
+        self.teams.revalidate()
+        for team in self.teams.find_all("member", user_id):
+            user_teams.append({
+                "name": team["name"],
+                "description": team["description"],
+                "creation_time": team["creation_time"]
+            })
 
         return json.dumps(user_teams, indent=2)
 
@@ -20,8 +20,29 @@ class UserBase:
         """
         pass
 
+    # create many users in one call
+    def create_users(self, request: str) -> str:
+        """
+        :param request: A json list of create_user requests
+        [
+          {
+            "name" : "<user_name>",
+            "display_name" : "<display name>"
+          }
+        ]
+        :return: A json list with one result per request, in the same order
+        [
+          {"id" : "<user_id>"} | {"error" : "<reason the user was not created>"}
+        ]
+
+        Constraint:
+            * same constraints as create_user, checked per user
+            * all users that pass are stored in a single write
+        """
+        pass
+
     # list all users
-    def list_users(self) -> str:
+    def list_users(self, request: str = None) -> str:
         """
         :return: A json list with the response
         [
@@ -31,6 +52,25 @@ class UserBase:
             "creation_time" : "<some date:time format>"
           }
         ]
+
+        With a request the listing is filtered and sorted by name; every key is optional.
+        "created_from" is inclusive, "created_until" exclusive. "fields" picks the fields
+        returned for each user. With a "limit" the response is one page, pass its
+        "next_cursor" back as "cursor" to get the next one (null on the last page):
+        :param request:
+        {
+          "name_prefix" : "<start of the name>",
+          "created_from" : "<date:time>",
+          "created_until" : "<date:time>",
+          "fields" : ["<field>", ...],
+          "limit" : <page size>,
+          "cursor" : "<next_cursor of the previous page>"
+        }
+        :return:
+        {
+          "items" : [<user as above>, ...],
+          "next_cursor" : "<cursor>" | null
+        }
         """
         pass
 